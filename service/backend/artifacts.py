@@ -0,0 +1,123 @@
+import hashlib
+import logging
+import pickle
+from pathlib import Path
+from typing import Any, Iterable, Tuple
+
+import numpy as np
+
+from compiled import CompiledLogReg, compile_model
+from publish import publish_directory
+
+logger = logging.getLogger(__name__)
+
+# Longer tokens are kept in a dict instead of widening the token array
+MAX_TOKEN_BYTES = 64
+
+
+class MappedLogReg(CompiledLogReg):
+    """
+    Compiled TF-IDF + LogisticRegression scorer backed by memory-mapped arrays.
+
+    The vocabulary is a sorted fixed-width array of UTF-8 tokens aligned with
+    the weight and idf arrays. All of them are mapped read-only from disk, so
+    every worker process of the node shares one copy through the page cache.
+    """
+
+    @classmethod
+    def load(cls, path: Path) -> "MappedLogReg":
+        scorer = cls.__new__(cls)
+        with open(path / "meta.pkl", "rb") as file:
+            scorer.__dict__.update(pickle.load(file))
+        scorer.path = path
+        scorer.tokens = np.load(path / "tokens.npy", mmap_mode="r")
+        scorer.weights = np.load(path / "weights.npy", mmap_mode="r")
+        scorer.idf = np.load(path / "idf.npy", mmap_mode="r")
+        scorer.vocabulary = None
+        scorer._analyzer = scorer._vectorizer.build_analyzer()
+        return scorer
+
+    def __getstate__(self) -> dict:
+        return {"path": self.path}
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(MappedLogReg.load(state["path"]).__dict__)
+
+    def _lookup(self, reviews: Iterable[str]) -> Tuple[np.ndarray, np.ndarray, int]:
+        tokenize = self._tokenize()
+        encoded = []
+        lengths = []
+        for review in reviews:
+            tokens = [token.encode() for token in tokenize(review)]
+            encoded.extend(tokens)
+            lengths.append(len(tokens))
+        rows = np.repeat(np.arange(len(lengths), dtype=np.int64), lengths)
+        indices = np.full(len(encoded), -1, dtype=np.int64)
+        if encoded:
+            width = self.tokens.dtype.itemsize
+            short = np.fromiter(
+                (len(token) <= width for token in encoded),
+                dtype=bool, count=len(encoded))
+            candidates = np.array(encoded, dtype=self.tokens.dtype)[short]
+            positions = np.searchsorted(self.tokens, candidates)
+            positions[positions == len(self.tokens)] = 0
+            found = self.tokens[positions] == candidates
+            indices[np.flatnonzero(short)[found]] = positions[found]
+            for position in np.flatnonzero(~short):
+                indices[position] = self.long_tokens.get(encoded[position], -1)
+        known = indices >= 0
+        return rows[known], indices[known], len(lengths)
+
+
+def export_artifact(scorer: CompiledLogReg, path: Path):
+    """Write the compiled scorer as a mappable artifact directory"""
+    tokens = [(token.encode(), index)
+              for token, index in scorer.vocabulary.items()]
+    short = sorted(item for item in tokens if len(item[0]) <= MAX_TOKEN_BYTES)
+    long_tokens = {token: index for token, index in tokens
+                   if len(token) > MAX_TOKEN_BYTES}
+    order = np.array([index for _, index in short], dtype=np.int64)
+    width = max((len(token) for token, _ in short), default=1)
+
+    def write(tmp: Path):
+        np.save(tmp / "tokens.npy",
+                np.array([token for token, _ in short], dtype=f"S{width}"))
+        # Weights are reordered to the sorted tokens, long tokens are
+        # appended after them
+        long_order = np.array(list(long_tokens.values()), dtype=np.int64)
+        full_order = np.concatenate([order, long_order])
+        np.save(tmp / "weights.npy", np.asarray(scorer.weights)[full_order])
+        np.save(tmp / "idf.npy", np.asarray(scorer.idf)[full_order])
+        meta = {
+            name: value for name, value in scorer.__dict__.items()
+            if name not in ("vocabulary", "weights", "idf", "_analyzer")
+        }
+        meta["long_tokens"] = {
+            token: len(order) + position
+            for position, token in enumerate(long_tokens)
+        }
+        with open(tmp / "meta.pkl", "wb") as file:
+            pickle.dump(meta, file)
+
+    publish_directory(path, write)
+
+
+def load_shared_model(root: str, name: str, content: bytes) -> Any:
+    """
+    Args:
+        root: directory of mappable artifacts shared by the worker processes
+        name: base model name
+        content: pickled model
+    Returns:
+        Any: memory-mapped scorer, or the compiled or plain model if it can't
+            be mapped
+    """
+    version = hashlib.sha256(content).hexdigest()[:16]
+    path = Path(root) / f"{name}-{version}"
+    if not path.exists():
+        model = compile_model(pickle.loads(content))
+        if not isinstance(model, CompiledLogReg):
+            return model
+        export_artifact(model, path)
+        logger.info(f"Exported mappable artifact of {name} to {path}")
+    return MappedLogReg.load(path)
@@ -0,0 +1,98 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Gathers concurrent prediction requests for one model into a single batch.
+
+    A batch is sent to the model when max_wait seconds passed since its first
+    request or when it reaches max_rows rows, whichever comes first.
+
+    Args:
+        name: model name used in logs and stats
+        predict: coroutine function scoring a batch of reviews
+        max_wait: maximum time in seconds a request waits for a batch
+        max_rows: number of rows which flushes a batch immediately
+    """
+
+    def __init__(
+            self,
+            name: str,
+            predict: Callable[[pd.Series], Awaitable[np.ndarray]],
+            max_wait: float,
+            max_rows: int
+    ):
+        self.name = name
+        self.max_wait = max_wait
+        self.max_rows = max_rows
+        self._predict = predict
+        self._pending: List[Tuple[pd.Series, asyncio.Future]] = []
+        self._pending_rows = 0
+        self._timer: asyncio.TimerHandle = None
+        self._running = set()
+        self.batches = 0
+        self.batched_requests = 0
+        self.batched_rows = 0
+
+    async def predict(self, data: pd.Series) -> np.ndarray:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((data, future))
+        self._pending_rows += len(data)
+        if self._pending_rows >= self.max_rows:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        items = self._pending
+        self._pending = []
+        self._pending_rows = 0
+        if items:
+            task = asyncio.create_task(self._run(items))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, items: List[Tuple[pd.Series, asyncio.Future]]):
+        items = [(data, future) for data, future in items if not future.done()]
+        if not items:
+            return
+        batch = pd.concat([data for data, _ in items], ignore_index=True)
+        self.batches += 1
+        self.batched_requests += len(items)
+        self.batched_rows += len(batch)
+        try:
+            labels = await self._predict(batch)
+        except Exception as error:
+            logger.error(f"Batch prediction for {self.name} failed: {str(error)}")
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        bounds = np.cumsum([len(data) for data, _ in items])[:-1]
+        for (_, future), part in zip(items, np.split(np.asarray(labels), bounds)):
+            if not future.done():
+                future.set_result(part)
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": len(self._pending),
+            "queued_rows": self._pending_rows,
+            "running_batches": len(self._running),
+            "batches": self.batches,
+            "batched_requests": self.batched_requests,
+            "batched_rows": self.batched_rows,
+            "mean_batch_rows": (
+                self.batched_rows / self.batches if self.batches else 0.0),
+        }
@@ -0,0 +1,27 @@
+import os
+import sys
+from pathlib import Path
+
+# Run as python -m bench.app from service/backend or from anywhere with
+# the backend directory on sys.path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import asyncpg  # noqa: E402
+import uvicorn  # noqa: E402
+
+import parsers.parser_must  # noqa: E402
+from bench.fake_db import create_pool  # noqa: E402
+
+# Local stand-ins have to be in place before server.py is imported
+asyncpg.create_pool = create_pool
+parsers.parser_must.BASE_URL = os.environ["BENCH_MUSTAPP_URL"]
+
+import server  # noqa: E402
+
+if __name__ == "__main__":
+    uvicorn.run(
+        server.app,
+        host="127.0.0.1",
+        port=int(os.environ["BENCH_PORT"]),
+        log_level="warning"
+    )
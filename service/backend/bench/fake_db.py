@@ -0,0 +1,131 @@
+import asyncio
+import re
+from itertools import count
+from typing import Any, Dict, List, Optional
+
+TABLE = re.compile(r"classification_reviews\.(\w+)", re.IGNORECASE)
+INSERT_COLUMNS = re.compile(r"\(([^)]*)\)\s*VALUES", re.IGNORECASE)
+WHERE = re.compile(r"WHERE\s+(\w+)\s*=\s*\$1", re.IGNORECASE)
+NEXTVAL = re.compile(r"nextval\(", re.IGNORECASE)
+
+BENCH_USER = "bench"
+
+
+class FakeDatabase:
+    """
+    In-memory stand-in for the reviews database.
+
+    Understands the simple statements the server issues: inserts with an
+    optional RETURNING id or an id reserved with nextval, selects and
+    deletes filtered by one column.
+    """
+
+    def __init__(self):
+        self.tables: Dict[str, List[dict]] = {
+            "users": [{"name": BENCH_USER, "login": BENCH_USER, "password": None}],
+            "predicts": [],
+            "models": [],
+        }
+        self._ids = {"predicts": count(1), "models": count(1)}
+
+    def run(self, query: str, args: tuple) -> List[dict]:
+        table = TABLE.search(query).group(1)
+        rows = self.tables.setdefault(table, [])
+        statement = query.split(None, 1)[0].upper()
+        where = WHERE.search(query)
+        if NEXTVAL.search(query):
+            return [{"nextval": next(self._ids[table])}]
+        match statement:
+            case "INSERT":
+                columns = [
+                    column.strip()
+                    for column in INSERT_COLUMNS.search(query).group(1).split(",")
+                ]
+                row = dict(zip(columns, args))
+                if table in self._ids and "id" not in row:
+                    row["id"] = next(self._ids[table])
+                rows.append(row)
+                return [row]
+            case "DELETE":
+                self.tables[table] = [
+                    row for row in rows if row.get(where.group(1)) != args[0]]
+                return []
+            case _:
+                if where is None:
+                    return list(rows)
+                return [row for row in rows if row.get(where.group(1)) == args[0]]
+
+
+class FakeConnection:
+    def __init__(self, database: FakeDatabase):
+        self._database = database
+
+    async def fetch(self, query: str, *args) -> List[dict]:
+        await asyncio.sleep(0)
+        return self._database.run(query, args)
+
+    async def fetchrow(self, query: str, *args) -> Optional[dict]:
+        rows = await self.fetch(query, *args)
+        return rows[0] if rows else None
+
+    async def fetchval(self, query: str, *args) -> Any:
+        row = await self.fetchrow(query, *args)
+        if row is None:
+            return None
+        return row["id"] if "id" in row else next(iter(row.values()))
+
+    async def execute(self, query: str, *args) -> str:
+        await self.fetch(query, *args)
+        return "OK"
+
+    def transaction(self):
+        return _Transaction()
+
+
+class _Transaction:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+class _Acquire:
+    def __init__(self, pool: "FakePool"):
+        self._pool = pool
+
+    async def __aenter__(self) -> FakeConnection:
+        self._pool.in_use += 1
+        return FakeConnection(self._pool.database)
+
+    async def __aexit__(self, *exc_info):
+        self._pool.in_use -= 1
+        return False
+
+
+class FakePool:
+    def __init__(self, max_size: int):
+        self.database = FakeDatabase()
+        self.max_size = max_size
+        self.in_use = 0
+
+    def acquire(self) -> _Acquire:
+        return _Acquire(self)
+
+    def get_size(self) -> int:
+        return max(self.in_use, 1)
+
+    def get_idle_size(self) -> int:
+        return self.get_size() - self.in_use
+
+    def get_max_size(self) -> int:
+        return self.max_size
+
+    async def close(self):
+        pass
+
+
+async def create_pool(dsn: str = None, min_size: int = 1, max_size: int = 10,
+                      **kwargs) -> FakePool:
+    """Drop-in replacement of asyncpg.create_pool"""
+    return FakePool(max_size)
@@ -0,0 +1,72 @@
+import pickle
+import random
+from io import BytesIO
+from pathlib import Path
+from typing import List
+
+import pandas as pd
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import Pipeline
+
+import constants
+
+POSITIVE_WORDS = [
+    "отлично", "хорошо", "супер", "рекомендую", "качественно", "удобно",
+    "быстро", "красиво", "понравилось", "доволен", "шедевр", "восторг",
+]
+NEGATIVE_WORDS = [
+    "плохо", "ужасно", "брак", "разочарован", "медленно", "неудобно",
+    "сломалось", "скучно", "обман", "возврат", "дорого", "отвратительно",
+]
+NEUTRAL_WORDS = [
+    "товар", "фильм", "доставка", "размер", "цвет", "упаковка", "сюжет",
+    "актёры", "цена", "продавец", "курьер", "ткань", "заказ", "финал",
+]
+
+
+def make_reviews(rows: int, seed: int) -> pd.DataFrame:
+    """Random reviews with a Sentiment label given by the prevailing words"""
+    rng = random.Random(seed)
+    reviews = []
+    sentiments = []
+    for _ in range(rows):
+        sentiment = rng.randint(0, 1)
+        own = POSITIVE_WORDS if sentiment else NEGATIVE_WORDS
+        other = NEGATIVE_WORDS if sentiment else POSITIVE_WORDS
+        words = rng.choices(own, k=rng.randint(2, 6)) \
+            + rng.choices(other, k=rng.randint(0, 1)) \
+            + rng.choices(NEUTRAL_WORDS, k=rng.randint(3, 20))
+        rng.shuffle(words)
+        # A number makes every review unique, so the prediction cache and
+        # deduplication don't hide the scoring cost
+        words.append(str(rng.getrandbits(32)))
+        reviews.append(" ".join(words))
+        sentiments.append(sentiment)
+    return pd.DataFrame({"Review": reviews, "Sentiment": sentiments})
+
+
+def make_csv(rows: int, seed: int, with_labels: bool = False) -> bytes:
+    data = make_reviews(rows, seed)
+    if not with_labels:
+        data = data[["Review"]]
+    buffer = BytesIO()
+    data.to_csv(buffer, index=False)
+    return buffer.getvalue()
+
+
+def make_review_texts(rows: int, seed: int) -> List[str]:
+    return make_reviews(rows, seed)["Review"].tolist()
+
+
+def write_base_models(storage_dir: Path, rows: int = 2000):
+    """Pickle a small TF-IDF + LogisticRegression pipeline for every base model"""
+    storage_dir.mkdir(parents=True, exist_ok=True)
+    for position, key in enumerate(constants.BASE_MODELS.values()):
+        data = make_reviews(rows, seed=position)
+        model = Pipeline([
+            ("tf", TfidfVectorizer()),
+            ("clf", LogisticRegression(random_state=42))
+        ])
+        model.fit(data["Review"], data["Sentiment"])
+        (storage_dir / key).write_bytes(pickle.dumps(model))
@@ -0,0 +1,46 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from bench.fixtures import make_review_texts
+
+
+class MustAppHandler(BaseHTTPRequestHandler):
+    """
+    Answers /{product}/watches like the MustApp API.
+
+    The product id is the number of reviews of the product, so a link
+    https://mustapp.com/p/500 yields 500 reviews.
+    """
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = url.path.strip("/").split("/")
+        if len(parts) != 2 or parts[1] != "watches" or not parts[0].isdigit():
+            self.send_error(404)
+            return
+        total = int(parts[0])
+        query = parse_qs(url.query)
+        limit = int(query.get("limit", ["20"])[0])
+        offset = int(query.get("offset", ["0"])[0])
+        texts = make_review_texts(min(limit, total), seed=offset)
+        body = json.dumps({
+            "total": total,
+            "watches": [{"review": {"body": text}} for text in texts],
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_mock_mustapp(host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve the mock API on a free port in a daemon thread"""
+    httpd = ThreadingHTTPServer((host, 0), MustAppHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
@@ -0,0 +1,320 @@
+"""
+End-to-end load test of the backend against local stand-ins.
+
+Usage (from service/backend):
+    python -m bench.run --concurrency 1 8 --rows 1000 10000 --output bench.json
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+import numpy as np
+import psutil
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+from bench.fake_db import BENCH_USER  # noqa: E402
+from bench.fixtures import make_csv, write_base_models  # noqa: E402
+from bench.mock_mustapp import start_mock_mustapp  # noqa: E402
+
+SCENARIOS = ("predict_csv", "predict_by_link", "fit")
+READY_TIMEOUT = 120
+RSS_SAMPLE_INTERVAL = 0.02
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def read_proc_status(pid: int, field: str) -> Optional[int]:
+    """Memory field of /proc/{pid}/status in bytes, None outside of Linux"""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith(f"{field}:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR,
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class BenchServer:
+    """server.py in a subprocess with local storage and an in-memory database"""
+
+    def __init__(self, workdir: Path, mustapp_url: str, env: dict):
+        self.workdir = workdir
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self._env = {
+            **os.environ,
+            "PYTHONPATH": str(BACKEND_DIR),
+            "STORAGE_BACKEND": "local",
+            "STORAGE_LOCAL_DIR": str(workdir / "storage"),
+            "BENCH_PORT": str(self.port),
+            "BENCH_MUSTAPP_URL": mustapp_url,
+            **env,
+        }
+        self.process: Optional[subprocess.Popen] = None
+
+    def start(self):
+        write_base_models(self.workdir / "storage")
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "bench.app"],
+            cwd=self.workdir, env=self._env)
+
+    async def wait_ready(self, client: httpx.AsyncClient):
+        deadline = time.monotonic() + READY_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(
+                    f"Server exited with code {self.process.returncode}")
+            try:
+                if (await client.get(f"{self.url}/readyz")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+        raise RuntimeError("Server was not ready in time")
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+def tree_rss(process: psutil.Process) -> Tuple[int, int]:
+    """
+    RSS of the process and the summed RSS of its descendants in bytes:
+    inference and training workers. Pages shared after fork are counted in
+    every process, so the sum overestimates the physical memory.
+    """
+    try:
+        own = process.memory_info().rss
+    except psutil.Error:
+        return 0, 0
+    children = 0
+    for child in process.children(recursive=True):
+        try:
+            children += child.memory_info().rss
+        except psutil.Error:
+            # Exited between the listing and the read
+            pass
+    return own, children
+
+
+async def sample_peak_rss(pid: int, peak: Dict[str, int], stop: asyncio.Event):
+    """Track the peaks of the server, its children and their sum in peak"""
+    process = psutil.Process(pid)
+    while not stop.is_set():
+        own, children = await asyncio.get_running_loop().run_in_executor(
+            None, tree_rss, process)
+        peak["server"] = max(peak["server"], own)
+        peak["children"] = max(peak["children"], children)
+        peak["total"] = max(peak["total"], own + children)
+        try:
+            await asyncio.wait_for(stop.wait(), RSS_SAMPLE_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+def make_request(
+        scenario: str,
+        client: httpx.AsyncClient,
+        url: str,
+        rows: int,
+        seed: int
+) -> Callable[[], Awaitable[httpx.Response]]:
+    """Prepare the payload up front so that only the request is timed"""
+    match scenario:
+        case "predict_csv":
+            content = make_csv(rows, seed)
+            return lambda: client.post(
+                f"{url}/predict/csv/goods",
+                data={"login": BENCH_USER},
+                files={"data_csv": ("reviews.csv", content, "text/csv")})
+        case "predict_by_link":
+            return lambda: client.post(
+                f"{url}/predict_by_link/mustapp/films",
+                data={"login": BENCH_USER,
+                      "link": f"https://mustapp.com/p/{rows}"})
+        case "fit":
+            content = make_csv(rows, seed, with_labels=True)
+            return lambda: client.post(
+                f"{url}/fit/csv",
+                data={"login": BENCH_USER, "model_name": f"bench-{seed}"},
+                files={"data": ("train.csv", content, "text/csv")})
+    raise ValueError(f"Unknown scenario: {scenario}")
+
+
+async def run_case(
+        server: BenchServer,
+        client: httpx.AsyncClient,
+        scenario: str,
+        concurrency: int,
+        rows: int,
+        requests: int,
+        warmup: int
+) -> dict:
+    for seed in range(warmup):
+        await make_request(scenario, client, server.url, rows, -1 - seed)()
+
+    calls = [make_request(scenario, client, server.url, rows, seed)
+             for seed in range(requests)]
+    latencies = []
+    errors = []
+    queue = asyncio.Queue()
+    for call in calls:
+        queue.put_nowait(call)
+
+    async def worker():
+        while not queue.empty():
+            call = queue.get_nowait()
+            started = time.perf_counter()
+            try:
+                response = await call()
+                if response.status_code != 200:
+                    errors.append(f"{response.status_code}: {response.text[:200]}")
+            except httpx.HTTPError as error:
+                errors.append(repr(error))
+            latencies.append(time.perf_counter() - started)
+
+    peak = {"server": 0, "children": 0, "total": 0}
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(
+        sample_peak_rss(server.process.pid, peak, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await sampler
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "rows": rows,
+        "requests": requests,
+        "errors": len(errors),
+        "error_samples": errors[:3],
+        "elapsed_s": round(elapsed, 4),
+        "throughput_rps": round(requests / elapsed, 3),
+        "rows_per_s": round(requests * rows / elapsed, 1),
+        "latency_ms": {
+            "mean": round(float(latencies_ms.mean()), 3),
+            "p50": round(float(np.percentile(latencies_ms, 50)), 3),
+            "p95": round(float(np.percentile(latencies_ms, 95)), 3),
+            "p99": round(float(np.percentile(latencies_ms, 99)), 3),
+            "max": round(float(latencies_ms.max()), 3),
+        },
+        "peak_rss_bytes": peak["total"] or None,
+        "peak_server_rss_bytes": peak["server"] or None,
+        "peak_children_rss_bytes": peak["children"] or None,
+    }
+
+
+async def run(args: argparse.Namespace) -> dict:
+    mustapp = start_mock_mustapp()
+    mustapp_url = f"http://127.0.0.1:{mustapp.server_address[1]}"
+    env = dict(item.split("=", 1) for item in args.env)
+    with tempfile.TemporaryDirectory(prefix="reviews-bench-") as workdir:
+        server = BenchServer(Path(workdir), mustapp_url, env)
+        server.start()
+        results = []
+        try:
+            limits = httpx.Limits(max_connections=max(args.concurrency))
+            async with httpx.AsyncClient(
+                    timeout=args.timeout, limits=limits) as client:
+                await server.wait_ready(client)
+                for scenario in args.scenarios:
+                    for rows in args.rows:
+                        for concurrency in args.concurrency:
+                            result = await run_case(
+                                server, client, scenario, concurrency, rows,
+                                args.requests, args.warmup)
+                            print(
+                                f"{scenario} rows={rows} concurrency={concurrency}: "
+                                f"{result['throughput_rps']} req/s, "
+                                f"p99 {result['latency_ms']['p99']} ms, "
+                                f"{result['errors']} errors",
+                                file=sys.stderr)
+                            results.append(result)
+            server_peak_rss = read_proc_status(server.process.pid, "VmHWM")
+        finally:
+            server.stop()
+            mustapp.shutdown()
+
+    return {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "env": env,
+        },
+        "server_peak_rss_bytes": server_peak_rss,
+        # Children come and go, their peak is only known from the samples
+        "tree_peak_rss_bytes": max(
+            (result["peak_rss_bytes"] or 0 for result in results), default=0) or None,
+        "results": results,
+    }
+
+
+def parse_args(argv: List[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS,
+                        default=list(SCENARIOS))
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8])
+    parser.add_argument("--rows", nargs="+", type=int, default=[1000, 10000],
+                        help="reviews per file, link or training set")
+    parser.add_argument("--requests", type=int, default=20,
+                        help="measured requests per case")
+    parser.add_argument("--warmup", type=int, default=1,
+                        help="unmeasured requests before each case")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--env", nargs="*", default=[], metavar="NAME=VALUE",
+                        help="extra server settings, e.g. INFERENCE_WORKERS=4")
+    parser.add_argument("--output", help="JSON report path, stdout by default")
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str] = None):
+    args = parse_args(argv)
+    report = asyncio.run(run(args))
+    content = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        Path(args.output).write_text(content + "\n")
+    else:
+        print(content)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+from typing import Any, Iterable, Optional, Tuple
+
+import numpy as np
+from sklearn.base import clone
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import Pipeline
+
+
+class CompiledLogReg:
+    """
+    TF-IDF + binary LogisticRegression pipeline folded into token weights.
+
+    For a review with term frequencies tf the pipeline computes
+    coef . normalize(tf * idf) + intercept. Since normalization is a scalar
+    per review, the logit is accumulated directly from a table of
+    idf * coef per token without building the sparse TF-IDF matrix.
+    Reviews are tokenized once and scored in a vectorized pass per batch.
+
+    Args:
+        vectorizer: fitted TfidfVectorizer of the pipeline
+        classifier: fitted binary LogisticRegression of the pipeline
+    """
+
+    def __init__(
+            self,
+            vectorizer: TfidfVectorizer,
+            classifier: LogisticRegression
+    ):
+        idf = vectorizer.idf_ if vectorizer.use_idf \
+            else np.ones(len(vectorizer.vocabulary_))
+        self.vocabulary = vectorizer.vocabulary_
+        self.weights = np.asarray(idf * classifier.coef_[0], dtype=np.float64)
+        self.idf = np.asarray(idf, dtype=np.float64)
+        self.intercept = float(classifier.intercept_[0])
+        self.classes_ = classifier.classes_
+        self.norm = vectorizer.norm
+        self.binary = vectorizer.binary
+        self.sublinear_tf = vectorizer.sublinear_tf
+        # Binary multinomial regression is a softmax over [-logit, logit]
+        self.proba_scale = 2.0 \
+            if getattr(classifier, "multi_class", None) == "multinomial" else 1.0
+        self._vectorizer = clone(vectorizer)
+        self._analyzer = self._vectorizer.build_analyzer()
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        del state["_analyzer"]
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self._analyzer = self._vectorizer.build_analyzer()
+
+    def _tokenize(self):
+        """Plain regex tokenizer when the analyzer is the default one"""
+        vectorizer = self._vectorizer
+        if vectorizer.analyzer != "word" or vectorizer.input != "content" \
+                or vectorizer.preprocessor is not None \
+                or vectorizer.tokenizer is not None \
+                or vectorizer.strip_accents is not None \
+                or vectorizer.stop_words is not None \
+                or tuple(vectorizer.ngram_range) != (1, 1):
+            return self._analyzer
+        analyzer = self._analyzer
+        tokenizer = vectorizer.build_tokenizer()
+        lowercase = vectorizer.lowercase
+
+        def tokenize(review):
+            if not isinstance(review, str):
+                return analyzer(review)
+            return tokenizer(review.lower() if lowercase else review)
+
+        return tokenize
+
+    def _lookup(self, reviews: Iterable[str]) -> Tuple[np.ndarray, np.ndarray, int]:
+        """
+        Returns:
+            Tuple[np.ndarray, np.ndarray, int]: review positions and feature
+                indices of every known token, number of reviews
+        """
+        tokenize = self._tokenize()
+        lookup = self.vocabulary.get
+        indices = []
+        lengths = []
+        for review in reviews:
+            found = [index for index in map(lookup, tokenize(review))
+                     if index is not None]
+            indices.extend(found)
+            lengths.append(len(found))
+        rows = np.repeat(np.arange(len(lengths), dtype=np.int64), lengths)
+        return rows, np.asarray(indices, dtype=np.int64), len(lengths)
+
+    def decision_function(self, reviews: Iterable[str]) -> np.ndarray:
+        rows, indices, n_reviews = self._lookup(reviews)
+        if not len(indices):
+            return np.full(n_reviews, self.intercept)
+
+        # Count every (review, token) pair once, the same as CountVectorizer
+        n_features = len(self.weights)
+        keys, tf = np.unique(rows * n_features + indices, return_counts=True)
+        rows, columns = np.divmod(keys, n_features)
+        tf = tf.astype(np.float64)
+        if self.binary:
+            tf[:] = 1.0
+        elif self.sublinear_tf:
+            tf = np.log(tf) + 1.0
+
+        dot = np.bincount(
+            rows, weights=tf * self.weights[columns], minlength=n_reviews)
+        if self.norm is not None:
+            values = tf * self.idf[columns]
+            if self.norm == "l2":
+                norm = np.sqrt(np.bincount(
+                    rows, weights=values * values, minlength=n_reviews))
+            else:
+                norm = np.bincount(
+                    rows, weights=np.abs(values), minlength=n_reviews)
+            np.divide(dot, norm, out=dot, where=norm > 0)
+        return dot + self.intercept
+
+    def predict(self, reviews: Iterable[str]) -> np.ndarray:
+        return self.classes_[(self.decision_function(reviews) > 0).astype(int)]
+
+    def predict_proba(self, reviews: Iterable[str]) -> np.ndarray:
+        positive = 1.0 / (1.0 + np.exp(
+            -self.proba_scale * self.decision_function(reviews)))
+        return np.column_stack([1.0 - positive, positive])
+
+
+def compile_model(model: Any) -> Any:
+    """Return the compiled form of a supported pipeline or the model itself"""
+    return compile_pipeline(model) or model
+
+
+def compile_pipeline(model: Any) -> Optional[CompiledLogReg]:
+    """
+    Args:
+        model: any loaded model
+    Returns:
+        Optional[CompiledLogReg]: compiled scorer or None if the model is not
+            a Pipeline of TfidfVectorizer and binary LogisticRegression
+    """
+    if not isinstance(model, Pipeline) or len(model.steps) != 2:
+        return None
+    vectorizer, classifier = model.steps[0][1], model.steps[1][1]
+    if type(vectorizer) is not TfidfVectorizer \
+            or type(classifier) is not LogisticRegression:
+        return None
+    if classifier.coef_.shape[0] != 1 or vectorizer.norm not in ("l1", "l2", None):
+        return None
+    return CompiledLogReg(vectorizer, classifier)
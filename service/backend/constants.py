@@ -13,4 +13,101 @@ path_model_mustapp = os.path.join(
 )
 path_model_both = os.path.join(
     os.getcwd(), "models", "model_wb_and_lamoda.pkl"
-)
\ No newline at end of file
+)
+USER_MODEL_CACHE_BYTES = int(
+    os.getenv("USER_MODEL_CACHE_BYTES", 512 * 1024 * 1024)
+)
+BUCKET = "classification.reviews"
+S3_ENDPOINT = "https://storage.yandexcloud.net"
+BASE_MODELS = {
+    "goods": "model_wb.pkl",
+    "clothes": "model_lamoda.pkl",
+    "films": "model_mustapp.pkl",
+    "goods-and-clothes": "model_wb_and_lamoda.pkl",
+}
+# Base models loaded at startup and required by /readyz, others load lazily
+EAGER_MODELS = [
+    name for name in os.getenv("EAGER_MODELS", ",".join(BASE_MODELS)).split(",")
+    if name
+]
+# "s3" for Yandex Object Storage, "local" for a filesystem directory
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "s3")
+STORAGE_LOCAL_DIR = os.getenv(
+    "STORAGE_LOCAL_DIR", os.path.join(os.getcwd(), "storage")
+)
+STORAGE_MAX_WORKERS = int(os.getenv("STORAGE_MAX_WORKERS", 16))
+# Streaming prediction: rows scored at once and object storage part size
+STREAM_CHUNK_ROWS = int(os.getenv("STREAM_CHUNK_ROWS", 50_000))
+STREAM_PART_BYTES = int(os.getenv("STREAM_PART_BYTES", 8 * 1024 * 1024))
+# Micro-batching of base model predictions, BATCH_MAX_WAIT_MS=0 disables it
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", 5))
+BATCH_MAX_ROWS = int(os.getenv("BATCH_MAX_ROWS", 2048))
+# Process pool for base model inference, INFERENCE_WORKERS=0 disables it
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", 0))
+INFERENCE_MIN_ROWS = int(os.getenv("INFERENCE_MIN_ROWS", 5_000))
+INFERENCE_CHUNK_ROWS = int(os.getenv("INFERENCE_CHUNK_ROWS", 10_000))
+# Prediction cache: LRU size in reviews and optional SQLite file surviving restarts
+PREDICTION_CACHE_ENTRIES = int(os.getenv("PREDICTION_CACHE_ENTRIES", 200_000))
+PREDICTION_CACHE_PATH = os.getenv("PREDICTION_CACHE_PATH") or None
+# Disk tier bounds: reviews kept and seconds a stored label is kept
+PREDICTION_CACHE_DISK_ENTRIES = int(os.getenv("PREDICTION_CACHE_DISK_ENTRIES", 5_000_000))
+PREDICTION_CACHE_MAX_AGE = float(os.getenv("PREDICTION_CACHE_MAX_AGE", 30 * 24 * 3600))
+# Background jobs: SQLite state, spooled inputs and concurrency
+JOBS_DB_PATH = os.getenv(
+    "JOBS_DB_PATH", os.path.join(os.getcwd(), "jobs", "jobs.sqlite")
+)
+JOBS_SPOOL_DIR = os.getenv(
+    "JOBS_SPOOL_DIR", os.path.join(os.getcwd(), "jobs", "spool")
+)
+PREDICT_JOB_WORKERS = int(os.getenv("PREDICT_JOB_WORKERS", 2))
+# Directory of memory-mapped base model artifacts shared by uvicorn workers.
+# Opt-in: mapped models save memory but score slower than the private
+# unpickled copy each process keeps by default
+MODEL_ARTIFACT_DIR = os.getenv("MODEL_ARTIFACT_DIR", "")
+# Largest number of texts accepted by /predict_json
+JSON_MAX_TEXTS = int(os.getenv("JSON_MAX_TEXTS", 1000))
+# Opt-in request profiling: requests with the X-Profile header equal to
+# PROFILING_TOKEN are profiled with cProfile and saved to PROFILE_DIR
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "").lower() in ("1", "true", "yes")
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+PROFILE_DIR = os.getenv(
+    "PROFILE_DIR", os.path.join(os.getcwd(), "profiles")
+)
+# Background training: concurrent training processes and their time limit
+FIT_JOB_WORKERS = int(os.getenv("FIT_JOB_WORKERS", 1))
+FIT_JOB_TIMEOUT = float(os.getenv("FIT_JOB_TIMEOUT", 3600))
+# Seconds without a heartbeat after which a running job of a dead server
+# process is queued again
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", 30))
+# Streaming training: rows per chunk and size of the hashed feature space
+TRAIN_CHUNK_ROWS = int(os.getenv("TRAIN_CHUNK_ROWS", 100_000))
+TRAIN_HASHING_FEATURES = int(os.getenv("TRAIN_HASHING_FEATURES", 2 ** 20))
+# Tuned training: wall-clock budget of the search and parallel fits (-1 for all cores)
+TUNE_BUDGET_SECONDS = float(os.getenv("TUNE_BUDGET_SECONDS", 300))
+TUNE_JOBS = int(os.getenv("TUNE_JOBS", -1))
+# Disk cache of vectorized training data, empty FEATURE_CACHE_DIR disables it
+FEATURE_CACHE_DIR = os.getenv(
+    "FEATURE_CACHE_DIR", os.path.join(os.getcwd(), "cache", "features")
+)
+FEATURE_CACHE_BYTES = int(os.getenv("FEATURE_CACHE_BYTES", 2 * 1024 * 1024 * 1024))
+# Keyset-paginated history and model listings: default and largest page size
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", 50))
+PAGE_MAX_SIZE = int(os.getenv("PAGE_MAX_SIZE", 500))
+# In-process cache of user records: seconds a known and an unknown login are
+# served without a database query, and the number of cached logins
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", 60))
+USER_CACHE_NEGATIVE_TTL = float(os.getenv("USER_CACHE_NEGATIVE_TTL", 5))
+USER_CACHE_ENTRIES = int(os.getenv("USER_CACHE_ENTRIES", 10_000))
+# Session tokens issued by /login: lifetime in seconds, cookie name (empty to
+# issue the token only in the X-Session-Token header) and whether requests
+# without a token are rejected instead of trusting the login field.
+# The signing key is SESSION_SECRET from the environment, or derived from PRIVATE_KEY
+SESSION_TTL = int(os.getenv("SESSION_TTL", 3600))
+SESSION_COOKIE = os.getenv("SESSION_COOKIE", "session")
+SESSION_REQUIRED = os.getenv("SESSION_REQUIRED", "").lower() in ("1", "true", "yes")
+# Terms and bigrams per class kept in the summary saved with every prediction
+SUMMARY_TOP_N = int(os.getenv("SUMMARY_TOP_N", 10))
+# Optional copy of every scored review in the predicted_reviews table, queried
+# by /get_reviews; written with binary COPY, REVIEW_COPY_ROWS rows at a time
+STORE_REVIEW_ROWS = os.getenv("STORE_REVIEW_ROWS", "").lower() in ("1", "true", "yes")
+REVIEW_COPY_ROWS = int(os.getenv("REVIEW_COPY_ROWS", 100_000))
@@ -0,0 +1,131 @@
+import hashlib
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Any, Optional, Tuple
+
+import numpy as np
+import sklearn
+from scipy import sparse
+
+from publish import publish_directory
+
+logger = logging.getLogger(__name__)
+
+MATRIX_FILE = "matrix.npz"
+LABELS_FILE = "labels.npy"
+VECTORIZER_FILE = "vectorizer.pkl"
+
+
+def file_digest(path: str) -> str:
+    """Content hash of an uploaded dataset"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def config_key(**config: Any) -> str:
+    """Stable hash of estimator settings, sklearn version included"""
+    items = sorted((name, repr(value)) for name, value in config.items())
+    return hashlib.sha256(
+        repr((sklearn.__version__, items)).encode()).hexdigest()[:16]
+
+
+class FeatureCache:
+    """
+    Content-addressed disk cache of vectorized training data.
+
+    An entry is a directory named after the dataset hash and the vectorizer
+    settings. It holds the sparse matrix, the labels and the fitted
+    vectorizer, and may also hold classifiers fitted on that matrix. Entries
+    are written to a temporary directory and renamed into place, so
+    concurrent training processes never see half-written entries. When the
+    cache outgrows max_bytes, least recently used entries are removed.
+
+    Args:
+        root: cache directory
+        max_bytes: total size of the entries kept on disk
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+
+    def _entry(self, dataset: str, vectorizer: str) -> Path:
+        return self.root / f"{dataset}-{vectorizer}"
+
+    def load(self, dataset: str, vectorizer: str) -> Optional[Tuple[Any, Any, np.ndarray]]:
+        """
+        Returns:
+            Optional[Tuple[Any, Any, np.ndarray]]: fitted vectorizer, sparse
+                matrix and labels, None on a miss
+        """
+        path = self._entry(dataset, vectorizer)
+        try:
+            with open(path / VECTORIZER_FILE, "rb") as file:
+                fitted = pickle.load(file)
+            matrix = sparse.load_npz(path / MATRIX_FILE)
+            labels = np.load(path / LABELS_FILE, allow_pickle=True)
+            os.utime(path)
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+            # Missing, or evicted by another process while being read
+            return None
+        return fitted, matrix, labels
+
+    def store(self, dataset: str, vectorizer: str, fitted: Any, matrix: Any,
+              labels: np.ndarray):
+        def write(tmp: Path):
+            sparse.save_npz(tmp / MATRIX_FILE, matrix.tocsr(), compressed=False)
+            np.save(tmp / LABELS_FILE, np.asarray(labels), allow_pickle=True)
+            with open(tmp / VECTORIZER_FILE, "wb") as file:
+                pickle.dump(fitted, file)
+
+        publish_directory(self._entry(dataset, vectorizer), write)
+        self.evict()
+
+    def load_model(self, dataset: str, vectorizer: str, model: str) -> Optional[Any]:
+        """Classifier fitted on the cached matrix with settings hashed as model"""
+        path = self._entry(dataset, vectorizer) / f"model-{model}.pkl"
+        try:
+            with open(path, "rb") as file:
+                fitted = pickle.load(file)
+            os.utime(path.parent)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        return fitted
+
+    def store_model(self, dataset: str, vectorizer: str, model: str, fitted: Any):
+        entry = self._entry(dataset, vectorizer)
+        if not entry.exists():
+            return
+        try:
+            with tempfile.NamedTemporaryFile(dir=entry, delete=False) as tmp:
+                pickle.dump(fitted, tmp)
+            os.replace(tmp.name, entry / f"model-{model}.pkl")
+        except OSError as error:
+            # The entry was evicted meanwhile
+            logger.warning(f"Model not cached: {str(error)}")
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for path in self.root.iterdir():
+            if path.name.startswith("."):
+                continue
+            try:
+                size = sum(item.stat().st_size for item in path.iterdir())
+                entries.append((path.stat().st_mtime, size, path))
+            except OSError:
+                continue
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            logger.info(f"Feature cache entry {path.name} evicted")
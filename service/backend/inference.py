@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+import profiling
+
+logger = logging.getLogger(__name__)
+
+# Models of the current worker process, filled once by the initializer
+_worker_models: Dict[str, Any] = {}
+
+
+def _init_worker(models: Dict[str, Any]):
+    _worker_models.update(models)
+
+
+def _warm_up() -> int:
+    return len(_worker_models)
+
+
+def _predict_in_worker(name: str, reviews: List[str]) -> np.ndarray:
+    return _worker_models[name].predict(reviews)
+
+
+class InferenceExecutor:
+    """
+    Process pool scoring base models outside of the GIL.
+
+    Workers are forked once the base models are loaded and inherit them, so
+    only review texts and labels travel between processes. Jobs smaller than
+    min_rows are scored in a thread of the server process, since shipping
+    them to a worker costs more than the prediction itself.
+
+    Args:
+        workers: number of worker processes, 0 disables the pool
+        min_rows: smallest job sent to the pool
+        chunk_rows: size of the slices a large job is split into
+
+    submitted and finished count the jobs handed to a thread and the
+    chunks handed to the pool, and the ones which are done.
+    """
+
+    def __init__(self, workers: int, min_rows: int, chunk_rows: int):
+        self.workers = workers
+        self.min_rows = min_rows
+        self.chunk_rows = chunk_rows
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._models = set()
+        self.submitted = 0
+        self.finished = 0
+
+    def start(self, models: Dict[str, Any]):
+        """
+        Args:
+            models: loaded base models by name inherited by the workers
+        """
+        if self.workers <= 0 or not models:
+            return
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("fork"),
+            initializer=_init_worker,
+            initargs=(models,)
+        )
+        # Fork every worker right away instead of on the first request
+        self._pool.submit(_warm_up)
+        self._models = set(models)
+        logger.info(
+            f"Inference pool started: {self.workers} workers, "
+            f"models {', '.join(sorted(self._models))}")
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    async def predict(self, name: str, model: Any, data: pd.Series) -> np.ndarray:
+        """
+        Args:
+            name: base model name or None for models unknown to the workers
+            model: the same model loaded in the server process
+            data: reviews to score
+        Returns:
+            np.ndarray: predicted labels
+        """
+        loop = asyncio.get_running_loop()
+        if self._pool is None or name not in self._models \
+                or len(data) < self.min_rows:
+            future = loop.run_in_executor(None, profiling.wrap(model.predict), data)
+            self.submitted += 1
+            future.add_done_callback(self._finish)
+            return await future
+        reviews = data.tolist()
+        chunks = [reviews[start:start + self.chunk_rows]
+                  for start in range(0, len(reviews), self.chunk_rows)]
+        futures = [loop.run_in_executor(self._pool, _predict_in_worker, name, chunk)
+                   for chunk in chunks]
+        self.submitted += len(futures)
+        for future in futures:
+            future.add_done_callback(self._finish)
+        return np.concatenate(await asyncio.gather(*futures))
+
+    def _finish(self, _: asyncio.Future):
+        self.finished += 1
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers if self._pool is not None else 0,
+            "models": sorted(self._models),
+            "submitted": self.submitted,
+            "finished": self.finished,
+        }
@@ -0,0 +1,441 @@
+import asyncio
+import datetime
+import json
+import logging
+import os
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from functools import partial
+from pathlib import Path
+from typing import Awaitable, BinaryIO, Callable, Dict, List, Optional
+
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    def __init__(self, row: sqlite3.Row):
+        self.id: str = row["id"]
+        self.kind: str = row["kind"]
+        self.state: str = row["state"]
+        self.params: dict = json.loads(row["params"])
+        self.input_path: Optional[str] = row["input_path"]
+        self.progress: int = row["progress"]
+        self.stage: Optional[str] = row["stage"]
+        self.result: Optional[dict] = \
+            json.loads(row["result"]) if row["result"] else None
+        self.error: Optional[str] = row["error"]
+        self.created_at: str = row["created_at"]
+        self.updated_at: str = row["updated_at"]
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "state": self.state,
+            "progress": self.progress,
+            "stage": self.stage,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+
+# States after which a job never changes again
+FINISHED_STATES = ("done", "failed", "cancelled")
+
+
+class JobStore:
+    """
+    SQLite table of jobs shared by all queues and all server processes
+    using the same path. A job runs in the process which claimed it; the
+    owner column names that process and heartbeat_at is renewed while the
+    job runs, so jobs of dead processes can be taken over.
+    """
+
+    def __init__(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    input_path TEXT,
+                    progress INTEGER NOT NULL DEFAULT 0,
+                    stage TEXT,
+                    result TEXT,
+                    error TEXT,
+                    owner TEXT,
+                    heartbeat_at REAL,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                )
+                """)
+
+    def create(self, job_id: str, kind: str, params: dict, input_path: str):
+        now = datetime.datetime.now().isoformat(timespec="seconds")
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO jobs (id, kind, state, params, input_path, "
+                "created_at, updated_at) VALUES (?, ?, 'queued', ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(params), input_path, now, now))
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return Job(row) if row else None
+
+    def update(self, job_id: str, owner: Optional[str] = None, **fields) -> bool:
+        """
+        Args:
+            owner: update only while the job is running in this process,
+                so a job cancelled meanwhile stays cancelled
+        Returns:
+            bool: whether the job was updated
+        """
+        fields["updated_at"] = datetime.datetime.now().isoformat(timespec="seconds")
+        if "result" in fields:
+            fields["result"] = json.dumps(fields["result"])
+        query = f"UPDATE jobs SET {', '.join(f'{name} = ?' for name in fields)} " \
+                "WHERE id = ?"
+        params = (*fields.values(), job_id)
+        if owner is not None:
+            query += " AND state = 'running' AND owner = ?"
+            params += (owner,)
+        with self._lock, self._connection:
+            return self._connection.execute(query, params).rowcount == 1
+
+    def claim(self, job_id: str, owner: str) -> bool:
+        """Mark a queued job running in owner, False if it isn't queued anymore"""
+        now = datetime.datetime.now().isoformat(timespec="seconds")
+        with self._lock, self._connection:
+            return self._connection.execute(
+                "UPDATE jobs SET state = 'running', owner = ?, heartbeat_at = ?, "
+                "updated_at = ? WHERE id = ? AND state = 'queued'",
+                (owner, time.time(), now, job_id)).rowcount == 1
+
+    def cancel(self, job_id: str) -> bool:
+        now = datetime.datetime.now().isoformat(timespec="seconds")
+        with self._lock, self._connection:
+            return self._connection.execute(
+                "UPDATE jobs SET state = 'cancelled', updated_at = ? "
+                "WHERE id = ? AND state IN ('queued', 'running')",
+                (now, job_id)).rowcount == 1
+
+    def release(self, job_id: str, owner: str):
+        """Put a job of owner back to queued, for another process to run it"""
+        now = datetime.datetime.now().isoformat(timespec="seconds")
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE jobs SET state = 'queued', owner = NULL, updated_at = ? "
+                "WHERE id = ? AND state = 'running' AND owner = ?",
+                (now, job_id, owner))
+
+    def heartbeat(self, owner: str, job_ids: List[str]) -> List[str]:
+        """
+        Renew the lease of the running jobs of owner.
+
+        Returns:
+            List[str]: jobs of job_ids which are no longer running in owner,
+                i.e. were cancelled by another process
+        """
+        lost = []
+        with self._lock, self._connection:
+            for job_id in job_ids:
+                updated = self._connection.execute(
+                    "UPDATE jobs SET heartbeat_at = ? WHERE id = ? "
+                    "AND state = 'running' AND owner = ?",
+                    (time.time(), job_id, owner)).rowcount
+                if not updated:
+                    lost.append(job_id)
+        return lost
+
+    def pending(self, kind: str, lease: float) -> List[str]:
+        """
+        Queued jobs and running jobs whose owner stopped renewing the
+        lease; the latter are put back to queued to be claimed again.
+        """
+        expired = time.time() - lease
+        now = datetime.datetime.now().isoformat(timespec="seconds")
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE jobs SET state = 'queued', owner = NULL, updated_at = ? "
+                "WHERE kind = ? AND state = 'running' "
+                "AND (heartbeat_at IS NULL OR heartbeat_at < ?)",
+                (now, kind, expired))
+            rows = self._connection.execute(
+                "SELECT id FROM jobs WHERE kind = ? AND state = 'queued' "
+                "ORDER BY created_at",
+                (kind,)).fetchall()
+        return [row["id"] for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class JobQueue:
+    """
+    Persistent queue of one kind of jobs run by a bounded pool of workers.
+
+    Job inputs are spooled to disk and job states are kept in the store,
+    so queued and interrupted jobs are picked up again after a restart.
+    Several server processes may share the store and the spool directory:
+    a job is claimed atomically before it runs, so it runs once, and the
+    claiming process renews a lease on it every lease / 3 seconds. Jobs
+    whose lease expired, because their process died, are queued again.
+    The same periodic check picks up jobs submitted to other processes and
+    stops local jobs cancelled through another process.
+
+    Args:
+        kind: job kind, e.g. "predict"
+        store: shared job store
+        spool_dir: directory for job input files
+        workers: number of jobs run at the same time
+        handler: coroutine function running a job, receives the job and a
+            progress callback taking a counter and an optional stage name,
+            and returns the job result
+        timeout: seconds after which a running job is cancelled and failed,
+            None for no limit
+        lease: seconds without a heartbeat after which a running job is
+            considered abandoned
+    """
+
+    def __init__(
+            self,
+            kind: str,
+            store: JobStore,
+            spool_dir: str,
+            workers: int,
+            handler: Callable[[Job, Callable[..., None]], Awaitable[dict]],
+            timeout: Optional[float] = None,
+            lease: float = 30.0
+    ):
+        self.kind = kind
+        self.workers = workers
+        self._store = store
+        self._spool_dir = Path(spool_dir)
+        self._handler = handler
+        self.timeout = timeout
+        self.lease = lease
+        # Identity of this process in the owner column
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._queue: asyncio.Queue = None
+        self._queued: set = set()
+        self._tasks: List[asyncio.Task] = []
+        self._running: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[str, List[asyncio.Future]] = {}
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    async def start(self):
+        self._spool_dir.mkdir(parents=True, exist_ok=True)
+        self._queue = asyncio.Queue()
+        pending = await self._run(self._store.pending, self.kind, self.lease)
+        self._enqueue(pending)
+        if pending:
+            logger.info(f"Resuming {len(pending)} {self.kind} jobs")
+        self._tasks = [asyncio.create_task(self._worker())
+                       for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._monitor()))
+
+    def _enqueue(self, job_ids: List[str]):
+        for job_id in job_ids:
+            if job_id not in self._queued and job_id not in self._running:
+                self._queued.add(job_id)
+                self._queue.put_nowait(job_id)
+
+    async def _monitor(self):
+        """Renew leases, stop jobs cancelled elsewhere, pick up other jobs"""
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                lost = await self._run(
+                    self._store.heartbeat, self.owner, list(self._running))
+                for job_id in lost:
+                    task = self._running.get(job_id)
+                    if task is not None:
+                        logger.info(f"{self.kind} job {job_id} stopped, "
+                                    f"it was cancelled by another process")
+                        task.cancel()
+                self._enqueue(await self._run(
+                    self._store.pending, self.kind, self.lease))
+            except sqlite3.Error as error:
+                logger.error(f"Job store error: {str(error)}")
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def submit(self, params: dict, fileobj: Optional[BinaryIO] = None) -> str:
+        job_id = uuid.uuid4().hex
+        input_path = None
+        if fileobj is not None:
+            input_path = str(self._spool_dir / job_id)
+            await self._run(copy_to_file, fileobj, input_path)
+        await self._run(
+            self._store.create, job_id, self.kind, params, input_path)
+        self._enqueue([job_id])
+        logger.info(f"{self.kind} job {job_id} queued")
+        return job_id
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def cancel(self, job_id: str) -> bool:
+        """
+        Cancel a queued or running job of this queue.
+
+        Returns:
+            bool: False if the job is unknown or already finished
+        """
+        job = await self._run(self._store.get, job_id)
+        if job is None or job.kind != self.kind:
+            return False
+        task = self._running.get(job_id)
+        if task is not None:
+            task.cancel()
+        elif await self._run(self._store.cancel, job_id):
+            # Queued jobs are never claimed now, a job running in another
+            # process is stopped by the monitor of that process
+            self._notify(job_id)
+        else:
+            return False
+        logger.info(f"{self.kind} job {job_id} cancelled")
+        return True
+
+    async def wait(self, job_id: str) -> Job:
+        """Wait until the job is done, failed or cancelled and return it"""
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(job_id, []).append(future)
+        try:
+            while True:
+                job = await self._run(self._store.get, job_id)
+                if job is None or job.state in FINISHED_STATES:
+                    return job
+                # Jobs run by other processes don't notify, poll for them
+                try:
+                    await asyncio.wait_for(asyncio.shield(future), self.lease / 3)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            waiters = self._waiters.get(job_id, [])
+            if future in waiters:
+                waiters.remove(future)
+            if not waiters:
+                self._waiters.pop(job_id, None)
+
+    def _notify(self, job_id: str):
+        for future in self._waiters.get(job_id, []):
+            if not future.done():
+                future.set_result(None)
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            self._queued.discard(job_id)
+            if not await self._run(self._store.claim, job_id, self.owner):
+                # Cancelled, or claimed by another process
+                job = await self._run(self._store.get, job_id)
+                if job is not None and job.state == "cancelled" \
+                        and job.input_path is not None:
+                    Path(job.input_path).unlink(missing_ok=True)
+                continue
+            job = await self._run(self._store.get, job_id)
+            logger.info(f"{self.kind} job {job_id} started")
+
+            progress = ProgressWriter(self._store, job_id, self.owner)
+            task = asyncio.create_task(
+                asyncio.wait_for(self._handler(job, progress), self.timeout))
+            self._running[job_id] = task
+            try:
+                result = await asyncio.shield(task)
+            except asyncio.CancelledError:
+                if not task.cancelled():
+                    # The worker itself is stopped, hand the job over to
+                    # another process or to a restart
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+                    self._store.release(job_id, self.owner)
+                    raise
+                await self._run(partial(
+                    self._store.update, job_id, self.owner, state="cancelled"))
+            except asyncio.TimeoutError:
+                detail = f"Timed out after {self.timeout} s"
+                logger.error(f"{self.kind} job {job_id} failed: {detail}")
+                await self._run(partial(
+                    self._store.update, job_id, self.owner, state="failed",
+                    error=detail))
+            except Exception as error:
+                detail = error.detail if isinstance(error, HTTPException) \
+                    else str(error)
+                logger.error(f"{self.kind} job {job_id} failed: {detail}")
+                await self._run(partial(
+                    self._store.update, job_id, self.owner, state="failed",
+                    error=detail))
+            else:
+                logger.info(f"{self.kind} job {job_id} done")
+                await self._run(partial(
+                    self._store.update, job_id, self.owner, state="done",
+                    result=result))
+            finally:
+                self._running.pop(job_id, None)
+            self._notify(job_id)
+            if job.input_path is not None:
+                Path(job.input_path).unlink(missing_ok=True)
+
+
+class ProgressWriter:
+    """
+    Progress callback of a running job. Handlers call it on the event loop,
+    so it only records the values; a task writes them to the store in the
+    executor, and updates arriving during a write are coalesced into the
+    next one. Writes are dropped once the job stopped running in owner.
+    """
+
+    def __init__(self, store: JobStore, job_id: str, owner: str):
+        self._store = store
+        self._job_id = job_id
+        self._owner = owner
+        self._pending: dict = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def __call__(self, value: int, stage: Optional[str] = None):
+        self._pending["progress"] = value
+        if stage is not None:
+            self._pending["stage"] = stage
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._write())
+
+    async def _write(self):
+        loop = asyncio.get_running_loop()
+        while self._pending:
+            fields, self._pending = self._pending, {}
+            try:
+                await loop.run_in_executor(None, partial(
+                    self._store.update, self._job_id, self._owner, **fields))
+            except sqlite3.Error as error:
+                logger.error(f"Job store error: {str(error)}")
+
+
+def copy_to_file(fileobj: BinaryIO, path: str):
+    fileobj.seek(0)
+    with open(f"{path}.part", "wb") as file:
+        shutil.copyfileobj(fileobj, file)
+    os.replace(f"{path}.part", path)
@@ -0,0 +1,197 @@
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import wraps
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# Upper bounds in seconds, from a cached JSON call to training a model
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0,
+)
+
+# Endpoint the current request or job is attributed to
+current_endpoint: ContextVar[str] = ContextVar("current_endpoint", default="other")
+
+Sample = Tuple[Dict[str, str], float]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(
+        f'{name}="{_escape(str(value))}"' for name, value in labels.items()) + "}"
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """
+    Prometheus histogram with a fixed set of label names.
+
+    Observing a value is a bisect and a few increments under a lock, so it
+    is cheap enough for every stage of every request.
+
+    Args:
+        name: metric name
+        documentation: help text
+        labelnames: names of the labels passed to observe
+        buckets: sorted upper bounds of the buckets
+    """
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            labelnames: Tuple[str, ...],
+            buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        # Per label values: counts per bucket (the last one is +Inf), sum
+        self._series: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, *labelvalues: str):
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = \
+                    [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}",
+                 f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(labelvalues, list(counts), total)
+                      for labelvalues, (counts, total) in self._series.items()]
+        for labelvalues, counts, total in sorted(series):
+            labels = dict(zip(self.labelnames, labelvalues))
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                lines.append(
+                    f"{self.name}_bucket{_labels({**labels, 'le': _number(bound)})} "
+                    f"{cumulative}")
+            lines.append(f"{self.name}_sum{_labels(labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(labels)} {cumulative}")
+        return lines
+
+
+class CallbackMetric:
+    """
+    Gauge or counter whose samples are read from the application on scrape.
+
+    Args:
+        name: metric name
+        documentation: help text
+        kind: "gauge" or "counter"
+        callback: function returning (labels, value) samples
+    """
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            kind: str,
+            callback: Callable[[], Iterable[Sample]]
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.callback = callback
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}",
+                 f"# TYPE {self.name} {self.kind}"]
+        for labels, value in self.callback():
+            lines.append(f"{self.name}{_labels(labels)} {_number(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, documentation: str,
+              callback: Callable[[], Iterable[Sample]]) -> CallbackMetric:
+        return self.register(CallbackMetric(name, documentation, "gauge", callback))
+
+    def counter(self, name: str, documentation: str,
+                callback: Callable[[], Iterable[Sample]]) -> CallbackMetric:
+        return self.register(CallbackMetric(name, documentation, "counter", callback))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "reviews_stage_seconds",
+    "Duration of request pipeline stages in seconds",
+    ("endpoint", "stage")
+))
+
+
+class StageTimer:
+    """Context manager timing a pipeline stage of the current endpoint"""
+
+    __slots__ = ("name", "started")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        STAGE_SECONDS.observe(
+            time.perf_counter() - self.started, current_endpoint.get(), self.name)
+
+
+def stage(name: str) -> StageTimer:
+    """
+    Usage:
+        with stage("read_csv"):
+            data = pd.read_csv(...)
+    """
+    return StageTimer(name)
+
+
+def instrument(endpoint: str):
+    """
+    Decorator of an endpoint coroutine attributing its stages to endpoint
+    and timing the whole call as the "total" stage.
+    """
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            token = current_endpoint.set(endpoint)
+            try:
+                with stage("total"):
+                    return await func(*args, **kwargs)
+            finally:
+                current_endpoint.reset(token)
+        return wrapper
+    return decorator
@@ -0,0 +1,94 @@
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional, Tuple
+
+from single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+class ModelCache:
+    """
+    In-process LRU registry of loaded models bounded by a byte budget.
+    Every model is kept with the version its loader reported, e.g. a hash
+    of the artifact, which lives and dies with the model.
+
+    Args:
+        max_bytes: total size of cached models after which the least
+            recently used ones are evicted
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[Hashable, Tuple[Any, int, Optional[str]]] = \
+            OrderedDict()
+        self._loading = SingleFlight()
+
+    async def get(
+            self,
+            key: Hashable,
+            loader: Callable[[], Awaitable[Tuple[Any, int, Optional[str]]]]
+    ) -> Tuple[Any, Optional[str]]:
+        """
+        Args:
+            key: cache key, e.g. (login, model_id)
+            loader: coroutine factory returning (model, size in bytes,
+                version), called only once for concurrent misses of the
+                same key
+        Returns:
+            Tuple[Any, Optional[str]]: cached or freshly loaded model and
+                its version
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[2]
+
+        if key in self._loading:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return await self._loading.run(key, lambda: self._load(key, loader))
+
+    async def _load(
+            self,
+            key: Hashable,
+            loader: Callable[[], Awaitable[Tuple[Any, int, Optional[str]]]]
+    ) -> Tuple[Any, Optional[str]]:
+        value, size, version = await loader()
+        self._put(key, value, size, version)
+        return value, version
+
+    def _put(self, key: Hashable, value: Any, size: int, version: Optional[str]):
+        if size > self.max_bytes:
+            logger.info(
+                f"Model {key} ({size} bytes) exceeds cache budget, not cached")
+            return
+        self.invalidate(key)
+        self._entries[key] = (value, size, version)
+        self.current_bytes += size
+        while self.current_bytes > self.max_bytes:
+            evicted_key, (_, evicted_size, _) = self._entries.popitem(last=False)
+            self.current_bytes -= evicted_size
+            self.evictions += 1
+            logger.info(f"Model {evicted_key} evicted from cache")
+
+    def invalidate(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.current_bytes -= entry[1]
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+        }
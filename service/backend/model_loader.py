@@ -0,0 +1,128 @@
+import asyncio
+import hashlib
+import logging
+import pickle
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ModelState:
+    def __init__(self, name: str, key: str):
+        self.name = name
+        self.key = key
+        self.state = "not_loaded"
+        self.model: Any = None
+        self.size: Optional[int] = None
+        self.version: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self.error: Optional[str] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "state": self.state,
+            "artifact": self.key,
+            "bytes": self.size,
+            "version": self.version,
+            "load_seconds": self.load_seconds,
+            "error": self.error,
+        }
+
+
+class BaseModelRegistry:
+    """
+    Loads base models concurrently in the background or lazily on first use.
+
+    Args:
+        artifacts: mapping of model name to object storage key
+        download: coroutine function returning artifact bytes by key
+        load: blocking function building a model from its name and
+            artifact bytes, unpickles them by default
+    """
+
+    def __init__(
+            self,
+            artifacts: Dict[str, str],
+            download: Callable[[str], Awaitable[bytes]],
+            load: Callable[[str, bytes], Any] = None
+    ):
+        self._download = download
+        self._load_model = load or (lambda name, content: pickle.loads(content))
+        self._models = {
+            name: ModelState(name, key) for name, key in artifacts.items()
+        }
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._models
+
+    def start(self, names: Iterable[str]):
+        """Schedule loading of the given models without waiting for them"""
+        for name in names:
+            self._schedule(self._models[name])
+
+    async def get(self, name: str) -> Any:
+        model_state = self._models[name]
+        if model_state.state == "ready":
+            return model_state.model
+        await asyncio.shield(self._schedule(model_state))
+        if model_state.state != "ready":
+            raise RuntimeError(
+                f"Model {name} is not available: {model_state.error}")
+        return model_state.model
+
+    async def wait(self, names: Iterable[str]) -> Dict[str, Any]:
+        """Wait for the given models and return the ones loaded successfully"""
+        names = list(names)
+        await asyncio.gather(
+            *[self.get(name) for name in names], return_exceptions=True)
+        return {name: self._models[name].model for name in names
+                if self._models[name].state == "ready"}
+
+    def version(self, name: str) -> Optional[str]:
+        """Content hash of the loaded artifact"""
+        return self._models[name].version
+
+    def ready(self, names: Iterable[str]) -> bool:
+        return all(self._models[name].state == "ready" for name in names)
+
+    def status(self) -> Dict[str, dict]:
+        return {name: state.to_dict() for name, state in self._models.items()}
+
+    async def close(self):
+        tasks = [state.task for state in self._models.values()
+                 if state.task is not None and not state.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _schedule(self, model_state: ModelState) -> asyncio.Task:
+        if model_state.task is None or (
+                model_state.task.done() and model_state.state == "failed"):
+            model_state.state = "loading"
+            model_state.task = asyncio.create_task(self._load(model_state))
+        return model_state.task
+
+    async def _load(self, model_state: ModelState):
+        loop = asyncio.get_running_loop()
+        model_state.error = None
+        logger.info(f"Loading base model {model_state.name}")
+        started = time.perf_counter()
+        try:
+            content = await self._download(model_state.key)
+            model_state.model = await loop.run_in_executor(
+                None, self._load_model, model_state.name, content)
+        except Exception as error:
+            model_state.state = "failed"
+            model_state.error = str(error)
+            logger.error(
+                f"Error loading base model {model_state.name}: {str(error)}")
+            return
+        model_state.size = len(content)
+        model_state.version = hashlib.sha256(content).hexdigest()[:16]
+        model_state.load_seconds = round(time.perf_counter() - started, 3)
+        model_state.state = "ready"
+        logger.info(
+            f"Base model {model_state.name} loaded in "
+            f"{model_state.load_seconds} s")
@@ -0,0 +1,89 @@
+import base64
+import datetime
+import json
+from typing import Any, List, Optional, Sequence, Tuple
+
+
+class InvalidCursor(ValueError):
+    """The cursor was not issued by this service or is from another listing"""
+
+
+def encode_cursor(kind: str, values: Sequence[Any]) -> str:
+    """
+    Opaque cursor pointing after the row with the given sort key.
+
+    Args:
+        kind: listing the cursor belongs to, checked on decoding
+        values: sort key of the last returned row, dates are stored as
+            ISO strings
+    """
+    payload = [kind, *(
+        value.isoformat() if isinstance(value, datetime.date) else value
+        for value in values)]
+    return base64.urlsafe_b64encode(
+        json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(kind: str, cursor: str, size: int) -> List[Any]:
+    """
+    Raises:
+        InvalidCursor: malformed cursor or one of another listing
+    Returns:
+        List[Any]: sort key values, dates still as ISO strings
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, UnicodeDecodeError) as error:
+        raise InvalidCursor("Malformed cursor") from error
+    if not isinstance(payload, list) or len(payload) != size + 1 \
+            or payload[0] != kind:
+        raise InvalidCursor(f"Not a {kind} cursor")
+    return payload[1:]
+
+
+def split_page(rows: list, limit: int) -> Tuple[list, bool]:
+    """Rows fetched with LIMIT limit + 1 and whether another page follows"""
+    return rows[:limit], len(rows) > limit
+
+
+def history_cursor(cursor: str) -> Tuple[datetime.date, int]:
+    date, predict_id = decode_cursor("history", cursor, 2)
+    try:
+        return datetime.date.fromisoformat(date), int(predict_id)
+    except (TypeError, ValueError) as error:
+        raise InvalidCursor("Malformed cursor") from error
+
+
+def models_cursor(cursor: str) -> int:
+    model_id, = decode_cursor("models", cursor, 1)
+    try:
+        return int(model_id)
+    except (TypeError, ValueError) as error:
+        raise InvalidCursor("Malformed cursor") from error
+
+
+def reviews_cursor(cursor: str) -> Tuple[int, int]:
+    predict_id, row_number = decode_cursor("reviews", cursor, 2)
+    try:
+        return int(predict_id), int(row_number)
+    except (TypeError, ValueError) as error:
+        raise InvalidCursor("Malformed cursor") from error
+
+
+def next_history_cursor(rows: list, has_more: bool) -> Optional[str]:
+    if not has_more:
+        return None
+    return encode_cursor("history", (rows[-1]["predict_date"], rows[-1]["id"]))
+
+
+def next_models_cursor(rows: list, has_more: bool) -> Optional[str]:
+    if not has_more:
+        return None
+    return encode_cursor("models", (rows[-1]["id"],))
+
+
+def next_reviews_cursor(rows: list, has_more: bool) -> Optional[str]:
+    if not has_more:
+        return None
+    return encode_cursor("reviews", (rows[-1]["predict_id"], rows[-1]["row_number"]))
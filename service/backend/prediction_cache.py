@@ -0,0 +1,268 @@
+import asyncio
+import hashlib
+import logging
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def review_digest(review: str) -> bytes:
+    """Hash of the exact review text, char analyzers see every whitespace"""
+    return hashlib.blake2b(review.encode(), digest_size=16).digest()
+
+
+class DiskTier:
+    """
+    SQLite table of predictions surviving restarts. Labels are keyed by the
+    model version too, so processes sharing the file while a model is
+    replaced never read labels of the other version; labels of replaced
+    versions are left to pruning.
+
+    The table is pruned when it is opened, when writes take it over
+    max_entries labels and at least every prune_interval seconds of
+    writing: labels older than max_age are deleted, then the oldest ones
+    beyond max_entries.
+
+    Args:
+        path: SQLite file
+        max_entries: stored labels after which the oldest are deleted
+        max_age: seconds a stored label is kept
+        prune_interval: seconds between deletions of expired labels
+    """
+
+    def __init__(
+            self,
+            path: str,
+            max_entries: int,
+            max_age: float,
+            prune_interval: float = 3600.0
+    ):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.prune_interval = prune_interval
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS predictions (
+                    model TEXT, version TEXT, digest BLOB, label BLOB,
+                    stored_at REAL,
+                    PRIMARY KEY (model, version, digest)
+                ) WITHOUT ROWID
+                """)
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS predictions_stored_at "
+                "ON predictions (stored_at)")
+        self._next_prune = 0.0
+        self._count()
+        self._prune()
+
+    def get_many(
+            self,
+            model: str,
+            version: str,
+            digests: List[bytes]
+    ) -> Dict[bytes, Any]:
+        found = {}
+        with self._lock:
+            for start in range(0, len(digests), 500):
+                part = digests[start:start + 500]
+                rows = self._connection.execute(
+                    "SELECT digest, label FROM predictions WHERE model = ? "
+                    f"AND version = ? AND digest IN ({','.join('?' * len(part))})",
+                    (model, version, *part)
+                ).fetchall()
+                found.update(
+                    (digest, pickle.loads(label)) for digest, label in rows)
+        return found
+
+    def put_many(self, model: str, version: str, items: List[Tuple[bytes, Any]]):
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?, ?)",
+                [(model, version, digest, pickle.dumps(label), now)
+                 for digest, label in items])
+            # Replaced rows are counted too, which only prunes a bit early
+            self._rows += len(items)
+            prune = self._rows > self.max_entries \
+                or time.monotonic() >= self._next_prune
+        if prune:
+            self._prune()
+
+    def _count(self):
+        with self._lock:
+            self._rows = self._connection.execute(
+                "SELECT COUNT(*) FROM predictions").fetchone()[0]
+
+    def _prune(self):
+        with self._lock, self._connection:
+            deleted = self._connection.execute(
+                "DELETE FROM predictions WHERE stored_at < ?",
+                (time.time() - self.max_age,)).rowcount
+            self._rows = self._connection.execute(
+                "SELECT COUNT(*) FROM predictions").fetchone()[0]
+            if self._rows > self.max_entries:
+                # Rows stored no later than the newest one to delete
+                cutoff, = self._connection.execute(
+                    "SELECT stored_at FROM predictions ORDER BY stored_at "
+                    "LIMIT 1 OFFSET ?",
+                    (self._rows - self.max_entries - 1,)).fetchone()
+                deleted += self._connection.execute(
+                    "DELETE FROM predictions WHERE stored_at <= ?",
+                    (cutoff,)).rowcount
+                self._rows = self._connection.execute(
+                    "SELECT COUNT(*) FROM predictions").fetchone()[0]
+        self._next_prune = time.monotonic() + self.prune_interval
+        if deleted:
+            logger.info(f"Deleted {deleted} cached predictions from disk")
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class PredictionCache:
+    """
+    Labels of already scored reviews keyed by model, model version and
+    review hash.
+
+    The memory tier is an LRU of at most max_entries labels, the optional
+    disk tier keeps at most disk_entries labels, none older than max_age.
+    Labels of a replaced model version are never looked up again and age
+    out of both tiers. Hashing and both tiers are worked in the executor,
+    the memory tier under a lock.
+
+    Hit and miss counters are kept per group, e.g. per base model with all
+    user models in one group, so their number stays bounded.
+
+    Args:
+        max_entries: capacity of the memory tier, 0 disables it
+        path: SQLite file of the disk tier, None disables it
+        disk_entries: capacity of the disk tier
+        max_age: seconds a label is kept in the disk tier
+    """
+
+    def __init__(
+            self,
+            max_entries: int,
+            path: Optional[str] = None,
+            disk_entries: int = 5_000_000,
+            max_age: float = 30 * 24 * 3600
+    ):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._memory: OrderedDict[Tuple[str, str, bytes], Any] = OrderedDict()
+        self._disk = DiskTier(path, disk_entries, max_age) if path else None
+        self._counters: Dict[str, List[int]] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 or self._disk is not None
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    async def lookup(
+            self,
+            model: str,
+            version: str,
+            reviews: List[str],
+            group: str
+    ) -> Tuple[List[bytes], List[Any]]:
+        """
+        Args:
+            group: counters the hits and misses are added to
+        Returns:
+            Tuple[List[bytes], List[Any]]: review digests and cached labels,
+                None for reviews which were not found
+        """
+        return await self._run(self._lookup, model, version, reviews, group)
+
+    def _lookup(
+            self,
+            model: str,
+            version: str,
+            reviews: List[str],
+            group: str
+    ) -> Tuple[List[bytes], List[Any]]:
+        digests = [review_digest(review) for review in reviews]
+        labels = []
+        missing = []
+        with self._lock:
+            for position, digest in enumerate(digests):
+                label = self._memory.get((model, version, digest))
+                if label is None:
+                    missing.append(position)
+                else:
+                    self._memory.move_to_end((model, version, digest))
+                labels.append(label)
+        if missing and self._disk is not None:
+            found = self._disk.get_many(
+                model, version, [digests[i] for i in missing])
+            with self._lock:
+                for position in missing:
+                    label = found.get(digests[position])
+                    if label is not None:
+                        labels[position] = label
+                        self._remember(model, version, digests[position], label)
+        misses = sum(label is None for label in labels)
+        with self._lock:
+            counters = self._counters.setdefault(group, [0, 0])
+            counters[0] += len(labels) - misses
+            counters[1] += misses
+        return digests, labels
+
+    async def store(
+            self,
+            model: str,
+            version: str,
+            digests: List[bytes],
+            labels: List[Any]
+    ):
+        await self._run(self._store, model, version, digests, labels)
+
+    def _store(self, model: str, version: str, digests: List[bytes], labels: List[Any]):
+        with self._lock:
+            for digest, label in zip(digests, labels):
+                self._remember(model, version, digest, label)
+        if self._disk is not None:
+            self._disk.put_many(model, version, list(zip(digests, labels)))
+
+    def _remember(self, model: str, version: str, digest: bytes, label: Any):
+        if self.max_entries <= 0:
+            return
+        self._memory[(model, version, digest)] = label
+        self._memory.move_to_end((model, version, digest))
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = {group: tuple(counts) for group, counts in self._counters.items()}
+        return {
+            "entries": len(self._memory),
+            "max_entries": self.max_entries,
+            "disk": self._disk is not None,
+            "groups": {
+                group: {
+                    "hits": hits,
+                    "misses": misses,
+                    "hit_ratio": hits / (hits + misses) if hits + misses else 0.0,
+                }
+                for group, (hits, misses) in counters.items()
+            },
+        }
+
+    def close(self):
+        if self._disk is not None:
+            self._disk.close()
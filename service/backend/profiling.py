@@ -0,0 +1,171 @@
+import asyncio
+import cProfile
+import hmac
+import logging
+import pstats
+import re
+import threading
+import uuid
+from contextvars import ContextVar
+from functools import wraps
+from pathlib import Path
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+HEADER = b"x-profile"
+REQUEST_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+class RequestProfile:
+    """cProfile data of one request: the event loop and its executor calls"""
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.loop_profile = cProfile.Profile()
+        self.thread_profiles: List[cProfile.Profile] = []
+
+    def save(self, path: Path):
+        stats = pstats.Stats(self.loop_profile)
+        for profile in self.thread_profiles:
+            stats.add(profile)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        stats.dump_stats(path)
+
+
+# Profile of the current request, only ever set by ProfilingMiddleware
+current_profile: ContextVar[Optional[RequestProfile]] = \
+    ContextVar("current_profile", default=None)
+
+
+def active() -> bool:
+    return current_profile.get() is not None
+
+
+def wrap(func: Callable) -> Callable:
+    """
+    Make a function passed to run_in_executor profiled when the calling
+    request is. Must be called on the event loop, where the request context
+    is visible; returns func itself for requests which are not profiled.
+    """
+    profile = current_profile.get()
+    if profile is None:
+        return func
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        thread_profile = cProfile.Profile()
+        try:
+            thread_profile.enable()
+        except ValueError:
+            # Python 3.12+ allows one profiler per interpreter, the loop
+            # profile already sees every thread
+            return func(*args, **kwargs)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            thread_profile.disable()
+            profile.thread_profiles.append(thread_profile)
+
+    return wrapper
+
+
+def profile_path(directory: str, request_id: str) -> Optional[Path]:
+    """Path of a saved profile or None for a malformed or unknown id"""
+    if not REQUEST_ID.match(request_id):
+        return None
+    path = Path(directory) / f"{request_id}.prof"
+    return path if path.exists() else None
+
+
+def check_token(token: str, value: Optional[str]) -> bool:
+    return value is not None and hmac.compare_digest(token.encode(), value.encode())
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware profiling requests which carry the X-Profile header
+    with the profiling token.
+
+    The profile is saved as {directory}/{request_id}.prof before the
+    response ends and the id is returned in the X-Profile-Id header. The
+    event loop profile also sees other requests running concurrently, so
+    only one request is profiled at a time. The middleware is added only when profiling is
+    enabled, so other deployments don't pay for it.
+
+    Args:
+        app: wrapped ASGI application
+        token: secret expected in the X-Profile header
+        directory: where profiles are saved
+    """
+
+    def __init__(self, app, token: str, directory: str):
+        self.app = app
+        self.token = token
+        self.directory = Path(directory)
+        self._lock = threading.Lock()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        value = dict(scope["headers"]).get(HEADER)
+        if value is None:
+            return await self.app(scope, receive, send)
+        if not check_token(self.token, value.decode("latin-1")):
+            logger.warning("Profiling requested with an invalid token")
+            return await self.app(scope, receive, send)
+        if not self._lock.acquire(blocking=False):
+            logger.warning(
+                f"Profiling of {scope['path']} skipped, another request is profiled")
+            return await self.app(
+                scope, receive, self._with_header(send, b"x-profile-error", b"busy"))
+
+        profile = RequestProfile(uuid.uuid4().hex)
+        path = self.directory / f"{profile.request_id}.prof"
+        saved = False
+
+        async def finish():
+            nonlocal saved
+            profile.loop_profile.disable()
+            if not saved:
+                saved = True
+                await asyncio.get_running_loop().run_in_executor(
+                    None, profile.save, path)
+                logger.info(
+                    f"Profile of {scope['method']} {scope['path']} saved to {path}")
+
+        async def send_profiled(message):
+            if message["type"] == "http.response.start":
+                message = {
+                    **message,
+                    "headers": [*message.get("headers", []),
+                                (b"x-profile-id", profile.request_id.encode())],
+                }
+            elif message["type"] == "http.response.body" \
+                    and not message.get("more_body", False):
+                # Save before the response ends, so the profile can be
+                # downloaded as soon as the client sees the id
+                await finish()
+            await send(message)
+
+        token = current_profile.set(profile)
+        try:
+            profile.loop_profile.enable()
+            try:
+                await self.app(scope, receive, send_profiled)
+            finally:
+                await finish()
+        finally:
+            current_profile.reset(token)
+            self._lock.release()
+
+    @staticmethod
+    def _with_header(send, name: bytes, value: bytes):
+        async def wrapped_send(message):
+            if message["type"] == "http.response.start":
+                message = {
+                    **message,
+                    "headers": [*message.get("headers", []), (name, value)],
+                }
+            await send(message)
+        return wrapped_send
@@ -0,0 +1,32 @@
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Callable
+
+
+def publish_directory(path: Path, write: Callable[[Path], None]):
+    """
+    Create the directory path atomically, so concurrent processes never
+    see it half-written.
+
+    write fills a hidden temporary sibling which is then renamed to path.
+    When another process published path first, its copy is kept.
+
+    Args:
+        path: directory to create
+        write: callback filling the temporary directory it is given
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = Path(tempfile.mkdtemp(dir=path.parent, prefix=f".{path.name}-"))
+    try:
+        write(tmp)
+        os.rename(tmp, path)
+    except OSError:
+        # Another process published the same directory first
+        shutil.rmtree(tmp, ignore_errors=True)
+        if not path.exists():
+            raise
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
@@ -0,0 +1,125 @@
+import asyncio
+from itertools import repeat
+from typing import Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+import profiling
+from metrics import stage
+
+SCHEMA = "classification_reviews"
+TABLE = "predicted_reviews"
+COLUMNS = ["owner", "predict_id", "row_number", "label", "review"]
+
+
+def _text(value) -> str:
+    # Postgres text can't hold NUL characters
+    return str(value).replace("\x00", "")
+
+
+def make_records(
+        owner: str,
+        predict_id: int,
+        first_row: int,
+        reviews: pd.Series,
+        labels: Iterable
+) -> List[tuple]:
+    labels = np.asarray(labels)
+    return list(zip(
+        repeat(owner),
+        repeat(predict_id),
+        range(first_row, first_row + len(labels)),
+        map(_text, labels.tolist()),
+        map(_text, reviews),
+    ))
+
+
+async def copy_reviews(
+        db,
+        owner: str,
+        predict_id: int,
+        reviews: pd.Series,
+        labels: Iterable,
+        batch_rows: int,
+        first_row: int = 0
+) -> int:
+    """
+    Write scored reviews to predicted_reviews with binary COPY, batch_rows
+    rows per COPY. Records are built off the event loop, the next batch
+    while the current one is copied.
+
+    Args:
+        db: connection
+        owner: login of the user
+        predict_id: prediction the rows belong to
+        reviews: review texts
+        labels: predicted labels, stored as text
+        batch_rows: rows per COPY statement
+        first_row: row number of the first review, for chunked predictions
+    Returns:
+        int: number of written rows
+    """
+    loop = asyncio.get_running_loop()
+    labels = np.asarray(labels)
+    build = profiling.wrap(make_records)
+
+    def prepare(start: int) -> asyncio.Future:
+        end = start + batch_rows
+        return loop.run_in_executor(
+            None, build, owner, predict_id, first_row + start,
+            reviews.iloc[start:end], labels[start:end])
+
+    starts = range(0, len(labels), batch_rows)
+    pending = prepare(0) if len(starts) else None
+    for start in starts:
+        records = await pending
+        # The next batch is built while this one is copied
+        pending = prepare(start + batch_rows) if start + batch_rows < len(labels) else None
+        with stage("copy_rows"):
+            await db.copy_records_to_table(
+                TABLE, schema_name=SCHEMA, columns=COLUMNS, records=records)
+    return len(labels)
+
+
+async def delete_reviews(db, owner: str, predict_id: int):
+    await db.execute(
+        f"DELETE FROM {SCHEMA}.{TABLE} WHERE owner = $1 AND predict_id = $2",
+        owner, predict_id)
+
+
+def reviews_query(
+        label: Optional[str],
+        predict_ids: Optional[List[int]],
+        after: Optional[tuple]
+) -> tuple:
+    """
+    Keyset-paginated select of a user's rows, newest first: by prediction
+    and by row number, both descending, so the cursor is a single row
+    comparison. Only the given filters are added and every variant is a
+    backward index range scan of one partition.
+
+    Returns:
+        tuple: query text with $1 for the owner and the limit as the last
+            parameter, and the parameters after the owner, limit excluded
+    """
+    conditions = ["owner = $1"]
+    params = []
+    if label is not None:
+        params.append(label)
+        conditions.append(f"label = ${len(params) + 1}")
+    if predict_ids:
+        params.append(predict_ids)
+        conditions.append(f"predict_id = ANY(${len(params) + 1}::integer[])")
+    if after is not None:
+        predict_id, row_number = after
+        params.extend((predict_id, row_number))
+        conditions.append(
+            f"(predict_id, row_number) < (${len(params)}, ${len(params) + 1})")
+    query = f"""
+            SELECT predict_id, row_number, label, review FROM {SCHEMA}.{TABLE}
+            WHERE {" AND ".join(conditions)}
+            ORDER BY predict_id DESC, row_number DESC
+            LIMIT ${len(params) + 2}
+            """
+    return query, params
@@ -1,28 +1,53 @@
 import os
 import asyncio
 import datetime
+import hashlib
+import hmac
+import json
 from io import BytesIO
 from contextlib import asynccontextmanager
-from typing import Annotated, List, Tuple
+from functools import partial
+from typing import Annotated, Any, BinaryIO, Callable, List, Optional, Tuple
 import logging
 from pathlib import Path
 import numpy as np
 import asyncpg
-import boto3
 import pickle
 import pandas as pd
 from dotenv import load_dotenv
 import uvicorn
 
-from fastapi import FastAPI, HTTPException, UploadFile, Form, File, Depends
+from fastapi import (
+    FastAPI, HTTPException, UploadFile, Form, File, Depends, Header, Cookie, Query,
+    Response
+)
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
+from pydantic import BaseModel, Field
 from asyncpg import Pool
 from rsa import decrypt, PrivateKey
 import constants
+import pagination
+import profiling
+from batching import MicroBatcher
+from artifacts import load_shared_model
+from compiled import CompiledLogReg, compile_model
+from inference import InferenceExecutor
+from jobs import Job, JobQueue, JobStore
+from metrics import REGISTRY, current_endpoint, instrument, stage
+from model_cache import ModelCache
+from model_loader import BaseModelRegistry
+from storage import ObjectStorage, create_storage
+from user_cache import UserCache
+from streaming import stream_predict_csv
+from summary import SummaryBuilder, summarize
 from parsers.parser_must import parser_must
-from sklearn.feature_extraction.text import TfidfVectorizer
+from prediction_cache import PredictionCache
+from review_rows import copy_reviews, delete_reviews, reviews_query
+from sessions import PasswordDigests, SessionSigner, session_secret
 from sklearn.linear_model import LogisticRegression
 from sklearn.pipeline import Pipeline
+from training import TRAINING_MODES, train_in_process
 
 # Configure logging
 log_dir = Path("logs")
@@ -35,7 +60,35 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 load_dotenv()
+
+
+def load_private_key() -> Optional[PrivateKey]:
+    pem_key = os.getenv("PRIVATE_KEY")
+    if not pem_key:
+        logger.error("PRIVATE_KEY is not set, login is unavailable")
+        return None
+    return PrivateKey.load_pkcs1(pem_key.encode())
+
+
+# Parsed once, loading the key is a large share of the cost of a login
+private_key = load_private_key()
+secret = session_secret(os.getenv("SESSION_SECRET", ""), os.getenv("PRIVATE_KEY"))
+sessions = SessionSigner(secret, ttl=constants.SESSION_TTL)
+password_digests = PasswordDigests(secret, max_entries=constants.USER_CACHE_ENTRIES)
 pool: Pool = None
+user_models = ModelCache(max_bytes=constants.USER_MODEL_CACHE_BYTES)
+dedup_counters = {"rows": 0, "unique_rows": 0}
+prediction_cache = PredictionCache(
+    max_entries=constants.PREDICTION_CACHE_ENTRIES,
+    path=constants.PREDICTION_CACHE_PATH,
+    disk_entries=constants.PREDICTION_CACHE_DISK_ENTRIES,
+    max_age=constants.PREDICTION_CACHE_MAX_AGE
+)
+users = UserCache(
+    ttl=constants.USER_CACHE_TTL,
+    negative_ttl=constants.USER_CACHE_NEGATIVE_TTL,
+    max_entries=constants.USER_CACHE_ENTRIES
+)
 app = FastAPI()
 
 # CORS allow the user agent to obtain permissions
@@ -46,42 +99,53 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Profile-Id", "X-Session-Token"],
 )
-
-try:
-    logger.info("Loading base models")
-    session = boto3.session.Session()
-    s3 = session.client(
-        service_name="s3",
-        endpoint_url="https://storage.yandexcloud.net",
-        aws_access_key_id=os.getenv("access_key"),
-        aws_secret_access_key=os.getenv("secret_access_key")
+if constants.PROFILING_ENABLED and not constants.PROFILING_TOKEN:
+    logger.warning("PROFILING_ENABLED is set without PROFILING_TOKEN, profiling is off")
+elif constants.PROFILING_ENABLED:
+    app.add_middleware(
+        profiling.ProfilingMiddleware,
+        token=constants.PROFILING_TOKEN,
+        directory=constants.PROFILE_DIR
     )
-    buffer = BytesIO()
-    s3.download_fileobj("classification.reviews", "model_wb.pkl", buffer)
-    buffer.seek(0)
-    model_wb = pickle.load(buffer)
-    buffer.close()
-    buffer = BytesIO()
-    s3.download_fileobj("classification.reviews", "model_lamoda.pkl", buffer)
-    buffer.seek(0)
-    model_lamoda = pickle.load(buffer)
-    buffer.close()
-    buffer = BytesIO()
-    s3.download_fileobj("classification.reviews", "model_mustapp.pkl", buffer)
-    buffer.seek(0)
-    model_mustapp = pickle.load(buffer)
-    buffer.close()
-    buffer = BytesIO()
-    s3.download_fileobj("classification.reviews", "model_wb_and_lamoda.pkl", buffer)
-    buffer.seek(0)
-    model_both = pickle.load(buffer)
-    buffer.close()
-    model_user = None
-    logger.info("Models loaded successfully")
-except Exception as error:
-    logger.error(f"Error loading models: {str(error)}")
-    raise
+
+    @app.get("/profiles/{request_id}")
+    async def get_profile(
+            request_id: str,
+            x_profile: Annotated[Optional[str], Header()] = None
+    ) -> FileResponse:
+        if not profiling.check_token(constants.PROFILING_TOKEN, x_profile):
+            raise HTTPException(status_code=403, detail="Invalid profiling token")
+        path = profiling.profile_path(constants.PROFILE_DIR, request_id)
+        if path is None:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        return FileResponse(
+            path, media_type="application/octet-stream", filename=path.name)
+
+
+def load_base_model(name: str, content: bytes):
+    if constants.MODEL_ARTIFACT_DIR:
+        return load_shared_model(constants.MODEL_ARTIFACT_DIR, name, content)
+    return compile_model(pickle.loads(content))
+
+
+storage: ObjectStorage = None
+job_store: JobStore = None
+predict_jobs: JobQueue = None
+fit_jobs: JobQueue = None
+base_models = BaseModelRegistry(
+    constants.BASE_MODELS, lambda key: storage.download(key), load_base_model)
+inference = InferenceExecutor(
+    workers=constants.INFERENCE_WORKERS,
+    min_rows=constants.INFERENCE_MIN_ROWS,
+    chunk_rows=constants.INFERENCE_CHUNK_ROWS
+)
+
+
+async def start_inference_pool():
+    models = await base_models.wait(constants.EAGER_MODELS)
+    inference.start(models)
 
 
 async def get_connection():
@@ -89,9 +153,91 @@ async def get_connection():
         yield connection
 
 
+async def get_user(login: str) -> Optional[dict]:
+    """User record from the user cache, None for an unknown login"""
+    async def load() -> Optional[dict]:
+        async with pool.acquire() as db:
+            user = await db.fetchrow(
+                "SELECT * FROM classification_reviews.users WHERE login = $1",
+                login)
+        return dict(user) if user is not None else None
+
+    with stage("user_lookup"):
+        return await users.get(login, load)
+
+
+def session_login(
+        authorization: Annotated[Optional[str], Header()] = None,
+        session: Annotated[
+            Optional[str], Cookie(alias=constants.SESSION_COOKIE or "session")] = None
+) -> Optional[str]:
+    """Login of the session token in the Authorization header or the cookie"""
+    token = None
+    if authorization is not None:
+        scheme, _, token = authorization.partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            raise HTTPException(status_code=401, detail="Bearer token expected")
+    elif constants.SESSION_COOKIE:
+        token = session
+    if token is None:
+        return None
+    login = sessions.verify(token.strip())
+    if login is None:
+        raise HTTPException(
+            status_code=401, detail="Invalid or expired session token",
+            headers={"WWW-Authenticate": "Bearer"})
+    return login
+
+
+async def require_login(claimed: Optional[str], session: Optional[str]) -> str:
+    """
+    Login of the request. A session token is verified without the database;
+    the login field is accepted as before, checked against the users table,
+    unless SESSION_REQUIRED is set.
+
+    Raises:
+        HTTPException: 401 without a usable identity, 403 when the login
+            field names another user than the token, 404 for an unknown login
+    """
+    if session is not None:
+        if claimed is not None and claimed != session:
+            logger.warning(f"Login {claimed} doesn't match the session of {session}")
+            raise HTTPException(
+                status_code=403, detail="Login doesn't match the session")
+        return session
+    if claimed is None or constants.SESSION_REQUIRED:
+        raise HTTPException(
+            status_code=401, detail="Session token required",
+            headers={"WWW-Authenticate": "Bearer"})
+    user = await get_user(claimed)
+    if user is None:
+        logger.warning(f"Request failed - user {claimed} not found")
+        raise HTTPException(status_code=404, detail="Login not found")
+    return user["login"]
+
+
+async def authenticated_login(
+        login: Annotated[Optional[str], Form()] = None,
+        session: Optional[str] = Depends(session_login)
+) -> str:
+    return await require_login(login, session)
+
+
+async def authenticated_query_login(
+        login: Annotated[Optional[str], Query()] = None,
+        session: Optional[str] = Depends(session_login)
+) -> str:
+    """authenticated_login for GET endpoints, with login in the query string"""
+    return await require_login(login, session)
+
+
 @asynccontextmanager
 async def lifespan(fastapi_app: FastAPI):
-    global pool
+    global pool, storage, job_store, predict_jobs, fit_jobs
+    storage = create_storage()
+    logger.info(f"Loading base models: {', '.join(constants.EAGER_MODELS)}")
+    base_models.start(constants.EAGER_MODELS)
+    inference_starter = asyncio.create_task(start_inference_pool())
     try:
         pool = await asyncpg.create_pool(
             dsn=os.getenv("DSN"),
@@ -99,18 +245,55 @@ async def lifespan(fastapi_app: FastAPI):
             max_size=20
         )
         logger.info("Database pool created successfully")
+        job_store = JobStore(constants.JOBS_DB_PATH)
+        predict_jobs = JobQueue(
+            "predict", job_store, constants.JOBS_SPOOL_DIR,
+            constants.PREDICT_JOB_WORKERS, run_predict_job,
+            lease=constants.JOB_LEASE_SECONDS)
+        await predict_jobs.start()
+        # Training has its own workers, so it never delays predictions
+        fit_jobs = JobQueue(
+            "fit", job_store, constants.JOBS_SPOOL_DIR,
+            constants.FIT_JOB_WORKERS, run_fit_job,
+            timeout=constants.FIT_JOB_TIMEOUT, lease=constants.JOB_LEASE_SECONDS)
+        await fit_jobs.start()
         yield
     except Exception as error:
         logger.error(f"Error creating database pool: {str(error)}")
         raise
     finally:
+        if fit_jobs is not None:
+            await fit_jobs.close()
+        if predict_jobs is not None:
+            await predict_jobs.close()
+        if job_store is not None:
+            job_store.close()
+        inference_starter.cancel()
+        inference.close()
+        await base_models.close()
+        prediction_cache.close()
         await pool.close()
         logger.info("Database pool closed")
+        storage.close()
 
 
 app.router.lifespan_context = lifespan
 
 
+@app.get("/healthz")
+async def healthz() -> dict:
+    return {"status": "ok", "models": base_models.status()}
+
+
+@app.get("/readyz")
+async def readyz():
+    ready = base_models.ready(constants.EAGER_MODELS)
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"ready": ready, "models": base_models.status()}
+    )
+
+
 @app.post("/register")
 async def register(
         name: Annotated[str, Form()],
@@ -131,6 +314,7 @@ async def register(
             """,
             name, login, read_password
         )
+        users.invalidate(login)
         logger.info(f"User {login} registered successfully")
         return True
     logger.warning(f"Registration failed - login {login} already in use")
@@ -141,110 +325,300 @@ async def register(
 async def login(
         login: Annotated[str, Form()],
         password: Annotated[UploadFile, File()],
-        db=Depends(get_connection)
+        response: Response
 ) -> bool:
+    """
+    Check the RSA-encrypted password. On success the response carries a
+    session token in the X-Session-Token header and the session cookie;
+    other endpoints accept it as "Authorization: Bearer <token>" instead
+    of the login field.
+    """
     logger.info(f"Login attempt for user: {login}")
-    user = await db.fetchrow(
-        "SELECT * FROM classification_reviews.users WHERE login = $1",
-        login)
+    user = await get_user(login)
     if user is None:
         logger.warning(f"Login failed - user {login} not found")
         raise HTTPException(status_code=404, detail="Login not found")
-    pem_key = os.getenv("PRIVATE_KEY").encode()
-    privkey = PrivateKey.load_pkcs1(pem_key)
+    if private_key is None:
+        raise HTTPException(status_code=500, detail="Login is not configured")
     read_password = await password.read()
-    read_password = decrypt(read_password, privkey)
-    correct_password = decrypt(user["password"], privkey)
-    result = (read_password == correct_password)
+    read_password = decrypt(read_password, private_key)
+    result = password_digests.matches(user["password"], read_password)
+    if result is None:
+        # First login of this password, later ones skip its decryption
+        correct_password = decrypt(user["password"], private_key)
+        password_digests.put(user["password"], correct_password)
+        result = hmac.compare_digest(read_password, correct_password)
     if result:
+        token = sessions.issue(login)
+        response.headers["X-Session-Token"] = token
+        if constants.SESSION_COOKIE:
+            response.set_cookie(
+                constants.SESSION_COOKIE, token, max_age=constants.SESSION_TTL,
+                httponly=True, samesite="lax")
         logger.info(f"User {login} logged in successfully")
     else:
         logger.warning(f"Login failed - incorrect password for user {login}")
     return result
 
 
+async def get_model(model_name: str, login: str = None):
+    model, _ = await get_model_version(model_name, login)
+    return model
+
+
+async def get_model_version(
+        model_name: str,
+        login: str = None
+) -> Tuple[Any, Optional[str]]:
+    """Loaded model and the content hash of its artifact"""
+    match model_name:
+        case name if name in base_models:
+            try:
+                return await base_models.get(name), base_models.version(name)
+            except RuntimeError as error:
+                logger.error(str(error))
+                raise HTTPException(status_code=503, detail=str(error))
+        case _:
+            try:
+                model_id = int(model_name)
+                if model_id <= 0:
+                    logger.warning(
+                        f"Invalid model number: {model_id} - must be positive")
+                    raise HTTPException(
+                        status_code=422, detail="Model number must be positive")
+            except ValueError:
+                logger.warning(
+                    f"Invalid model format: {model_name} - must be a number")
+                raise HTTPException(
+                    status_code=422, detail="Model must be a number")
+
+            try:
+                return await user_models.get(
+                    (login, model_id),
+                    lambda: download_model_from_s3(login, model_id))
+            except Exception as error:
+                logger.error(
+                    f"Error downloading model from S3: {str(error)}")
+                raise HTTPException(
+                    status_code=500, detail=f"Error downloading model from S3: {str(error)}")
+
+
+async def predict_base_model(model_name: str, data: pd.Series) -> np.ndarray:
+    model = await get_model(model_name)
+    return await inference.predict(model_name, model, data)
+
+
+batchers = {
+    name: MicroBatcher(
+        name,
+        partial(predict_base_model, name),
+        max_wait=constants.BATCH_MAX_WAIT_MS / 1000,
+        max_rows=constants.BATCH_MAX_ROWS
+    )
+    for name in constants.BASE_MODELS
+}
+
+
 async def predict_async(
         model_name: str,
         data: pd.Series,
-        login: str = None
+        login: str = None,
+        batch: bool = True
+) -> np.ndarray:
+    codes, uniques = pd.factorize(data, use_na_sentinel=False)
+    dedup_counters["rows"] += len(data)
+    dedup_counters["unique_rows"] += len(uniques)
+    if len(uniques) < len(data):
+        logger.info(
+            f"Scoring {len(uniques)} unique reviews out of {len(data)} "
+            f"({1 - len(uniques) / len(data):.1%} duplicates)")
+    with stage("predict"):
+        labels = await predict_cached_async(
+            model_name, pd.Series(uniques), login, batch)
+    return np.asarray(labels)[codes]
+
+
+async def predict_cached_async(
+        model_name: str,
+        data: pd.Series,
+        login: str = None,
+        batch: bool = True
+) -> np.ndarray:
+    if not prediction_cache.enabled:
+        return await score_async(model_name, data, login, batch)
+    model, version = await get_model_version(model_name, login)
+    if model_name in base_models:
+        model_key = group = model_name
+    else:
+        # Statistics of user models are pooled, logins stay out of metrics
+        model_key, group = f"{login}_{int(model_name)}", "user"
+    digests, labels = await prediction_cache.lookup(
+        model_key, version, [str(review) for review in data], group)
+    missing = [position for position, label in enumerate(labels) if label is None]
+    if missing:
+        predicted = await score_async(
+            model_name, data.iloc[missing], login, batch, model)
+        for position, label in zip(missing, predicted):
+            labels[position] = label
+        await prediction_cache.store(
+            model_key, version, [digests[position] for position in missing],
+            list(predicted))
+    return np.asarray(labels)
+
+
+async def score_async(
+        model_name: str,
+        data: pd.Series,
+        login: str = None,
+        batch: bool = True,
+        model: Any = None
 ) -> np.ndarray:
+    """
+    Args:
+        model: the loaded user model, when the caller has it already
+    """
+    batcher = batchers.get(model_name)
+    with stage("score"):
+        # A profiled request is scored alone, other requests stay out of its profile
+        if batch and batcher is not None and constants.BATCH_MAX_WAIT_MS > 0 \
+                and len(data) < constants.BATCH_MAX_ROWS \
+                and not profiling.active():
+            return await batcher.predict(data)
+        if model_name in base_models:
+            return await predict_base_model(model_name, data)
+        if model is None:
+            model = await get_model(model_name, login)
+        return await inference.predict(None, model, data)
+
+
+async def download_model_from_s3(
+        login: str,
+        model_id: int
+) -> Tuple[Pipeline, int, str]:
     loop = asyncio.get_running_loop()
+    content = await storage.download(f"{login}_{model_id}.pkl")
+    size = len(content)
+    version = hashlib.sha256(content).hexdigest()[:16]
+    user_model = await loop.run_in_executor(
+        None, profiling.wrap(lambda: compile_model(pickle.loads(content))))
+    logger.info(f"User model {login}_{model_id} loaded ({size} bytes)")
+    return user_model, size, version
 
-    async def get_model():
-        match model_name:
-            case "goods":
-                return model_wb
-            case "clothes":
-                return model_lamoda
-            case "films":
-                return model_mustapp
-            case "goods-and-clothes":
-                return model_both
-            case _:
-                try:
-                    model_id = int(model_name)
-                    if model_id <= 0:
-                        logger.warning(
-                            f"Invalid model number: {model_id} - must be positive")
-                        raise HTTPException(
-                            status_code=422, detail="Model number must be positive")
-                except ValueError:
-                    logger.warning(
-                        f"Invalid model format: {model_name} - must be a number")
-                    raise HTTPException(
-                        status_code=422, detail="Model must be a number")
 
-                try:
-                    return await download_model_from_s3(login, model_id)
-                except Exception as error:
-                    logger.error(
-                        f"Error downloading model from S3: {str(error)}")
-                    raise HTTPException(
-                        status_code=500, detail=f"Error downloading model from S3: {str(error)}")
+def executor_queue_depth():
+    # Work handed to an executor and not finished yet, running or queued
+    yield {"executor": "storage"}, storage.submitted - storage.finished
+    yield {"executor": "inference"}, inference.submitted - inference.finished
+    if predict_jobs is not None:
+        yield {"executor": "predict_jobs"}, predict_jobs.queue_depth()
+    if fit_jobs is not None:
+        yield {"executor": "fit_jobs"}, fit_jobs.queue_depth()
 
-    model = await get_model()
-    return await loop.run_in_executor(None, lambda: model.predict(data))
 
+def executor_tasks():
+    for name, executor in (("storage", storage), ("inference", inference)):
+        yield {"executor": name, "event": "submitted"}, executor.submitted
+        yield {"executor": name, "event": "finished"}, executor.finished
 
-async def download_model_from_s3(login: str, model_id: int):
-    session = boto3.session.Session()
-    s3 = session.client(
-        service_name="s3",
-        endpoint_url="https://storage.yandexcloud.net",
-        aws_access_key_id=os.getenv("access_key"),
-        aws_secret_access_key=os.getenv("secret_access_key")
-    )
-    buffer = BytesIO()
-    s3.download_fileobj("classification.reviews",
-                        f"{login}_{model_id}.pkl", buffer)
-    buffer.seek(0)
-    user_model = pickle.load(buffer)
-    buffer.close()
-    return user_model
 
+def cache_entries():
+    yield {"cache": "user_models"}, user_models.stats()["entries"]
+    yield {"cache": "users"}, users.stats()["entries"]
+    yield {"cache": "predictions"}, prediction_cache.stats()["entries"]
 
-@app.post("/predict/{data_type}/{model}")
-async def get_predict(
-        model: str,
-        data_type: str,
-        login: Annotated[str, Form()],
-        data_csv: Annotated[UploadFile, File()],
-        db=Depends(get_connection)
-) -> int:
-    logger.info(
-        f"Prediction request from user {login} using model {model} and data type {data_type}")
-    user = await db.fetchrow("SELECT * FROM classification_reviews.users WHERE login = $1", login)
-    if user is None:
-        logger.warning(f"Prediction failed - user {login} not found")
-        raise HTTPException(status_code=404, detail="Login not found")
 
-    content = await data_csv.read()
+def db_pool_connections():
+    if pool is None:
+        return
+    size, idle = pool.get_size(), pool.get_idle_size()
+    yield {"state": "in_use"}, size - idle
+    yield {"state": "idle"}, idle
+    yield {"state": "max"}, pool.get_max_size()
+
+
+def model_memory_bytes():
+    base_bytes = sum(state["bytes"] or 0 for state in base_models.status().values()
+                     if state["state"] == "ready")
+    yield {"kind": "base"}, base_bytes
+    yield {"kind": "user"}, user_models.current_bytes
+
+
+def cache_events():
+    user_cache = user_models.stats()
+    for event in ("hits", "misses", "evictions"):
+        yield {"cache": "user_models", "model": "", "event": event}, user_cache[event]
+    user_lookups = users.stats()
+    for event in ("hits", "misses", "evictions", "invalidations"):
+        yield {"cache": "users", "model": "", "event": event}, user_lookups[event]
+    for group, counters in prediction_cache.stats()["groups"].items():
+        for event in ("hits", "misses"):
+            yield {"cache": "predictions", "model": group, "event": event}, counters[event]
+
+
+def batching_totals():
+    for name, batcher in batchers.items():
+        batcher_stats = batcher.stats()
+        for field in ("batches", "batched_requests", "batched_rows"):
+            yield {"model": name, "field": field}, batcher_stats[field]
+
+
+REGISTRY.gauge(
+    "reviews_executor_queue_depth",
+    "Work items submitted to an executor and not finished yet",
+    executor_queue_depth)
+REGISTRY.counter(
+    "reviews_executor_tasks_total",
+    "Work items submitted to and finished by the storage and inference executors",
+    executor_tasks)
+REGISTRY.gauge(
+    "reviews_inference_workers",
+    "Worker processes of the inference pool",
+    lambda: [({}, inference.stats()["workers"])])
+REGISTRY.gauge(
+    "reviews_db_pool_connections",
+    "Database pool connections by state",
+    db_pool_connections)
+REGISTRY.gauge(
+    "reviews_model_memory_bytes",
+    "Serialized size of the loaded models",
+    model_memory_bytes)
+REGISTRY.gauge(
+    "reviews_cache_entries",
+    "Entries held in the memory of the model, prediction and user caches",
+    cache_entries)
+REGISTRY.counter(
+    "reviews_cache_events_total",
+    "Hits, misses and evictions of the model, prediction and user caches",
+    cache_events)
+REGISTRY.counter(
+    "reviews_dedup_rows_total",
+    "Scored rows before and after deduplication",
+    lambda: [({"kind": "rows"}, dedup_counters["rows"]),
+             ({"kind": "unique_rows"}, dedup_counters["unique_rows"])])
+REGISTRY.counter(
+    "reviews_batching_total",
+    "Micro-batches and the requests and rows they gathered",
+    batching_totals)
+REGISTRY.gauge(
+    "reviews_batching_queue_depth",
+    "Requests waiting for a micro-batch",
+    lambda: [({"model": name}, batcher.stats()["queue_depth"])
+             for name, batcher in batchers.items()])
+
+
+@app.get("/metrics")
+async def metrics() -> PlainTextResponse:
+    return PlainTextResponse(
+        REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def read_upload(data_type: str, content: bytes) -> pd.DataFrame:
     try:
         match data_type:
             case "csv":
-                data = pd.read_csv(BytesIO(content))
+                return pd.read_csv(BytesIO(content))
             case "excel":
-                data = pd.read_excel(BytesIO(content))
+                return pd.read_excel(BytesIO(content))
             case _:
                 logger.warning(f"Invalid data type: {data_type}")
                 raise HTTPException(
@@ -254,6 +628,9 @@ async def get_predict(
         raise HTTPException(
             status_code=400, detail=f"Error reading {data_type} file: {str(error)}")
 
+
+async def predict_dataframe(model: str, login: str, data: pd.DataFrame) -> str:
+    """Add the predict column to data and return the model name to record"""
     if "Review" not in data.columns:
         logger.warning("Review column not found in input data")
         raise HTTPException(status_code=422, detail="Review column not found")
@@ -268,55 +645,354 @@ async def get_predict(
             status_code=500, detail=f"Prediction error: {str(error)}")
 
     data["predict"] = y_pred
+    return model
+
+
+async def discard_prediction(db, login: str, predict_id: int):
+    """Remove the record and the stored rows of a prediction which failed"""
+    if constants.STORE_REVIEW_ROWS:
+        await delete_reviews(db, login, predict_id)
+    await db.execute(
+        "DELETE FROM classification_reviews.predicts WHERE id = $1", predict_id)
+
+
+def serialize_csv(data: pd.DataFrame) -> BytesIO:
+    csv_buffer = BytesIO()
+    data.to_csv(csv_buffer, index=False)
+    csv_buffer.seek(0)
+    return csv_buffer
+
+
+async def save_prediction(db, login: str, model: str, data: pd.DataFrame) -> int:
+    """
+    Persist a scored DataFrame: the predicts record with its summary (and
+    the review rows with STORE_REVIEW_ROWS) and the result CSV.
+
+    The id is reserved from the predicts sequence first, so the database
+    writes and the CSV serialization and upload run concurrently, the CPU
+    work in executors. When one side fails, whatever the other side wrote
+    is removed before the error is returned.
+    """
+    loop = asyncio.get_running_loop()
+    with stage("insert"):
+        predict_id = await db.fetchval(
+            "SELECT nextval(pg_get_serial_sequence('classification_reviews.predicts', 'id'))")
+    key = f"{login}_{predict_id}.csv"
+
+    async def write_record():
+        with stage("summarize"):
+            summary = await loop.run_in_executor(None, profiling.wrap(partial(
+                summarize, data["Review"], data["predict"].to_numpy(),
+                constants.SUMMARY_TOP_N)))
+        query = """
+                INSERT INTO classification_reviews.predicts
+                (id, owner, used_model, predict_date, summary) VALUES
+                ($1, $2, $3, $4, $5::jsonb)
+                """
+        with stage("insert"):
+            await db.execute(
+                query, predict_id, login, model, datetime.date.today(),
+                json.dumps(summary))
+        if constants.STORE_REVIEW_ROWS:
+            await copy_reviews(db, login, predict_id, data["Review"],
+                               data["predict"], constants.REVIEW_COPY_ROWS)
+
+    uploading: Optional[asyncio.Task] = None
+
+    async def write_file():
+        nonlocal uploading
+        with stage("serialize"):
+            csv_buffer = await loop.run_in_executor(
+                None, profiling.wrap(serialize_csv), data)
+        with stage("upload"):
+            # The upload thread can't be stopped, discard() waits for it
+            uploading = asyncio.create_task(storage.upload_fileobj(csv_buffer, key))
+            await asyncio.shield(uploading)
+
+    async def discard():
+        # The record may be partly written even when its step failed
+        try:
+            await discard_prediction(db, login, predict_id)
+        except Exception as discard_error:
+            logger.error(f"Error discarding prediction {predict_id}: {str(discard_error)}")
+        if uploading is not None:
+            await asyncio.gather(uploading, return_exceptions=True)
+        if uploading is not None and not uploading.cancelled() \
+                and uploading.exception() is None:
+            try:
+                await storage.delete(key)
+            except Exception as delete_error:
+                logger.error(f"Error deleting {key}: {str(delete_error)}")
+
+    try:
+        record_result, file_result = await asyncio.gather(
+            write_record(), write_file(), return_exceptions=True)
+    except asyncio.CancelledError:
+        logger.warning(f"Saving prediction {predict_id} cancelled")
+        await asyncio.shield(discard())
+        raise
+    errors = [result for result in (record_result, file_result)
+              if isinstance(result, BaseException)]
+    if not errors:
+        logger.info(
+            f"Prediction results uploaded to S3 for user {login}, predict_id {predict_id}")
+        return predict_id
+
+    logger.error(f"Error saving prediction {predict_id}: {str(errors[0])}")
+    await asyncio.shield(discard())
+    raise HTTPException(
+        status_code=500, detail=f"Error saving results: {str(errors[0])}")
+
+
+@app.post("/predict/{data_type}/{model}")
+@instrument("get_predict")
+async def get_predict(
+        model: str,
+        data_type: str,
+        login: Annotated[str, Depends(authenticated_login)],
+        data_csv: Annotated[UploadFile, File()],
+        streaming: bool = False
+) -> int:
+    logger.info(
+        f"Prediction request from user {login} using model {model} and data type {data_type}")
+
+    if streaming:
+        if data_type != "csv":
+            logger.warning(f"Streaming mode is not supported for {data_type}")
+            raise HTTPException(
+                status_code=422, detail="Streaming mode supports only csv")
+        return await predict_csv_streaming(model, login, data_csv.file)
+
+    with stage("read_upload"):
+        data = read_upload(data_type, await data_csv.read())
+    used_model = await predict_dataframe(model, login, data)
+    # The connection is taken only to save, not held while predicting
+    async with pool.acquire() as db:
+        return await save_prediction(db, login, used_model, data)
+
+
+async def predict_csv_streaming(
+        model: str,
+        login: str,
+        fileobj: BinaryIO,
+        on_chunk: Callable[[int], None] = None
+) -> int:
+    """
+    Score a CSV chunk by chunk while the result is uploaded in parts. Pool
+    connections are taken per database write, none is held while scoring.
+    """
+    used_model = f"{login}_{model}" if model.isdigit() else model
     query = """
             INSERT INTO classification_reviews.predicts (owner, used_model, predict_date) VALUES
             ($1, $2, $3)
             RETURNING id;
             """
-    predict_id = await db.fetchval(query, user["login"], model, datetime.date.today())
+    with stage("insert"):
+        async with pool.acquire() as db:
+            predict_id = await db.fetchval(
+                query, login, used_model, datetime.date.today())
+    upload = storage.multipart_upload(
+        f"{login}_{predict_id}.csv", constants.STREAM_PART_BYTES)
+    summary = SummaryBuilder(constants.SUMMARY_TOP_N)
+    store_rows = None
+    if constants.STORE_REVIEW_ROWS:
+        async def store_rows(chunk: pd.DataFrame, first_row: int):
+            async with pool.acquire() as db:
+                await copy_reviews(db, login, predict_id, chunk["Review"], chunk["predict"],
+                                   constants.REVIEW_COPY_ROWS, first_row)
 
-    csv_buffer = BytesIO()
-    data.to_csv(csv_buffer, index=False)
-    csv_buffer.seek(0)
+    async def discard():
+        try:
+            await upload.abort()
+        except Exception as abort_error:
+            logger.error(f"Error aborting upload: {str(abort_error)}")
+        async with pool.acquire() as db:
+            await discard_prediction(db, login, predict_id)
 
     try:
-        session = boto3.session.Session()
-        s3 = session.client(
-            service_name="s3",
-            endpoint_url="https://storage.yandexcloud.net",
-            aws_access_key_id=os.getenv("access_key"),
-            aws_secret_access_key=os.getenv("secret_access_key")
+        rows = await stream_predict_csv(
+            fileobj,
+            lambda reviews: predict_async(model, reviews, login),
+            upload,
+            constants.STREAM_CHUNK_ROWS,
+            on_chunk,
+            summary,
+            store_rows
         )
-        s3.upload_fileobj(csv_buffer, "classification.reviews",
-                          f"{user['login']}_{predict_id}.csv")
-        logger.info(
-            f"Prediction results uploaded to S3 for user {login}, predict_id {predict_id}")
-    except Exception as e:
-        logger.error(f"Error uploading to S3: {str(e)}")
+        with stage("insert"):
+            async with pool.acquire() as db:
+                await db.execute(
+                    """
+                    UPDATE classification_reviews.predicts SET summary = $2::jsonb
+                    WHERE id = $1
+                    """,
+                    predict_id, json.dumps(summary.result()))
+        with stage("upload"):
+            await upload.complete()
+    except Exception as error:
+        logger.error(f"Streaming prediction {predict_id} failed: {str(error)}")
+        await asyncio.shield(discard())
+        if isinstance(error, HTTPException):
+            raise
         raise HTTPException(
-            status_code=500, detail=f"Error saving results: {str(e)}")
-
+            status_code=500, detail=f"Prediction error: {str(error)}")
+    except BaseException:
+        # Cancelled, e.g. a job through /jobs/{job_id}/cancel
+        logger.warning(f"Streaming prediction {predict_id} cancelled")
+        await asyncio.shield(discard())
+        raise
+    logger.info(
+        f"Streaming prediction {predict_id} for user {login} finished: {rows} rows")
     return predict_id
 
 
+async def run_predict_job(job: Job, progress: Callable[[int], None]) -> dict:
+    loop = asyncio.get_running_loop()
+    model = job.params["model"]
+    login = job.params["login"]
+    data_type = job.params["data_type"]
+    current_endpoint.set("predict_job")
+    if data_type == "csv":
+        with open(job.input_path, "rb") as file:
+            predict_id = await predict_csv_streaming(model, login, file, progress)
+    else:
+        content = await loop.run_in_executor(
+            None, Path(job.input_path).read_bytes)
+        with stage("read_upload"):
+            data = read_upload(data_type, content)
+        used_model = await predict_dataframe(model, login, data)
+        progress(len(data))
+        async with pool.acquire() as db:
+            predict_id = await save_prediction(db, login, used_model, data)
+    return {"predict_id": predict_id, "location": f"{login}_{predict_id}.csv"}
+
+
+@app.post("/jobs/predict/{data_type}/{model}")
+async def submit_predict_job(
+        model: str,
+        data_type: str,
+        login: Annotated[str, Depends(authenticated_login)],
+        data_csv: Annotated[UploadFile, File()]
+) -> dict:
+    logger.info(
+        f"Prediction job from user {login} using model {model} and data type {data_type}")
+    if data_type not in ("csv", "excel"):
+        logger.warning(f"Invalid data type: {data_type}")
+        raise HTTPException(status_code=404, detail="Data type not found")
+    job_id = await predict_jobs.submit(
+        {"model": model, "login": login, "data_type": data_type},
+        data_csv.file)
+    return {"job_id": job_id}
+
+
+async def get_own_job(job_id: str, login: str) -> Job:
+    """Job of the user, jobs of other users are reported as not found"""
+    loop = asyncio.get_running_loop()
+    job = await loop.run_in_executor(None, job_store.get, job_id)
+    if job is None or job.params.get("login") != login:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(
+        job_id: str,
+        login: Annotated[str, Depends(authenticated_query_login)]
+) -> dict:
+    job = await get_own_job(job_id, login)
+    return job.to_dict()
+
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(
+        job_id: str,
+        login: Annotated[str, Depends(authenticated_login)]
+) -> dict:
+    job = await get_own_job(job_id, login)
+    queue = {"predict": predict_jobs, "fit": fit_jobs}[job.kind]
+    if not await queue.cancel(job_id):
+        raise HTTPException(
+            status_code=409, detail=f"Job is already {job.state}")
+    return {"job_id": job_id, "cancelled": True}
+
+
+class JsonPredictRequest(BaseModel):
+    # Not needed with a session token
+    login: Optional[str] = None
+    texts: List[str] = Field(min_length=1, max_length=constants.JSON_MAX_TEXTS)
+    probabilities: bool = True
+    persist: bool = False
+
+
+class JsonPredictResponse(BaseModel):
+    labels: List[Any]
+    classes: Optional[List[Any]] = None
+    probabilities: Optional[List[List[float]]] = None
+    predict_id: Optional[int] = None
+
+
+def predicts_argmax(model: Any) -> bool:
+    """Whether predict of the model is the argmax of its predict_proba"""
+    estimator = model.steps[-1][1] if isinstance(model, Pipeline) else model
+    return isinstance(estimator, (CompiledLogReg, LogisticRegression))
+
+
+@app.post("/predict_json/{model}")
+@instrument("predict_json")
+async def predict_json(
+        model: str,
+        request: JsonPredictRequest,
+        session: Optional[str] = Depends(session_login)
+) -> JsonPredictResponse:
+    login = await require_login(request.login, session)
+
+    reviews = pd.Series(request.texts)
+    loaded_model = await get_model(model, login) if request.probabilities else None
+    response = JsonPredictResponse(labels=[])
+    labels = None
+    if hasattr(loaded_model, "predict_proba"):
+        codes, uniques = pd.factorize(reviews, use_na_sentinel=False)
+        loop = asyncio.get_running_loop()
+        with stage("predict"):
+            probabilities = np.asarray(await loop.run_in_executor(
+                None, profiling.wrap(loaded_model.predict_proba), pd.Series(uniques)))
+        classes = np.asarray(loaded_model.classes_)
+        response.classes = classes.tolist()
+        response.probabilities = probabilities[codes].tolist()
+        if predicts_argmax(loaded_model):
+            # The same pass gives the labels, predict would repeat it
+            dedup_counters["rows"] += len(reviews)
+            dedup_counters["unique_rows"] += len(uniques)
+            labels = classes[probabilities.argmax(axis=1)][codes]
+    if labels is None:
+        # Skip micro-batching, its wait would dominate the latency of small calls
+        labels = await predict_async(model, reviews, login, batch=False)
+    response.labels = labels.tolist()
+
+    if request.persist:
+        data = pd.DataFrame({"Review": reviews, "predict": labels})
+        used_model = f"{login}_{model}" if model.isdigit() else model
+        async with pool.acquire() as db:
+            response.predict_id = await save_prediction(
+                db, login, used_model, data)
+    return response
+
+
 @app.post("/predict_by_link/{parser}/{model}")
+@instrument("predict_by_link")
 async def predict_by_link(
     model: str,
     parser: str,
     link: Annotated[str, Form()],
-    login: Annotated[str, Form()],
-    db=Depends(get_connection)
+    login: Annotated[str, Depends(authenticated_login)]
 ) -> int:
     logger.info(
         f"Prediction request from user {login} using model {model} and link {link}")
-    user = await db.fetchrow("Select * from classification_reviews.users where login = $1", login)
-    if user is None:
-        logger.warning(f"Prediction failed - user {login} not found")
-        raise HTTPException(status_code=404, detail="Login not found")
     try:
         match parser:
             case "mustapp":
-                data = await parser_must(link)
+                with stage("parse_link"):
+                    data = await parser_must(link)
                 logger.info(f"Data from mustapp parser: {data.head()}")
             case _:
                 logger.warning(f"Invalid parser: {parser}")
@@ -328,48 +1004,16 @@ async def predict_by_link(
 
     y_pred = await predict_async(model, data["Review"], login)
     data["predict"] = y_pred
-    query = """
-            INSERT INTO classification_reviews.predicts (owner, used_model, predict_date) VALUES
-            ($1, $2, $3)
-            RETURNING id;
-            """
-    predict_id = await db.fetchval(query, user["login"], model, datetime.date.today())
-
-    csv_buffer = BytesIO()
-    data.to_csv(csv_buffer, index=False)
-    csv_buffer.seek(0)
-
-    try:
-        session = boto3.session.Session()
-        s3 = session.client(
-            service_name="s3",
-            endpoint_url="https://storage.yandexcloud.net",
-            aws_access_key_id=os.getenv("access_key"),
-            aws_secret_access_key=os.getenv("secret_access_key")
-        )
-        s3.upload_fileobj(csv_buffer, "classification.reviews",
-                          f"{user['login']}_{predict_id}.csv")
-        logger.info(
-            f"Prediction results uploaded to S3 for user {login}, predict_id {predict_id}")
-    except Exception as e:
-        logger.error(f"Error uploading to S3: {str(e)}")
-        raise HTTPException(
-            status_code=500, detail=f"Error saving results: {str(e)}")
-
-    return predict_id
+    async with pool.acquire() as db:
+        return await save_prediction(db, login, model, data)
 
 
 @app.post("/get_history")
 async def get_history(
-    login: Annotated[str, Form()],
+    login: Annotated[str, Depends(authenticated_login)],
     db=Depends(get_connection)
 ) -> List[Tuple[int, datetime.date]]:
     logger.info(f"History request from user: {login}")
-    user = await db.fetchrow("Select * from classification_reviews.users where login = $1", login)
-    if user is None:
-        logger.warning(f"History request failed - user {login} not found")
-        raise HTTPException(status_code=404, detail="Login not found")
-
     query = """ Select id, predict_date from classification_reviews.predicts
             Where owner = $1
             """
@@ -378,92 +1022,248 @@ async def get_history(
     return [(predict["id"], predict["predict_date"]) for predict in predicts]
 
 
-async def logreg_fit(data: pd.DataFrame):
-    logreg_model = Pipeline([
-        ('tf', TfidfVectorizer()),
-        ('clf', LogisticRegression(random_state=42))
-    ])
-    logreg_model.fit(data["Review"].apply(str), data["Sentiment"])
-    return logreg_model
+class HistoryPage(BaseModel):
+    items: List[Tuple[int, datetime.date]]
+    next_cursor: Optional[str] = None
 
 
-@app.post("/fit/{type}")
-async def fit(
-    type: str,
-    data: Annotated[UploadFile, File()],
-    login: Annotated[str, Form()],
-    model_name: Annotated[str, Form()],
+class ModelsPage(BaseModel):
+    items: List[Tuple[int, str]]
+    next_cursor: Optional[str] = None
+
+
+PageLimit = Annotated[int, Form(ge=1, le=constants.PAGE_MAX_SIZE)]
+
+
+@app.post("/get_history_page")
+async def get_history_page(
+    login: Annotated[str, Depends(authenticated_login)],
+    limit: PageLimit = constants.PAGE_SIZE,
+    cursor: Annotated[Optional[str], Form()] = None,
     db=Depends(get_connection)
-) -> int:
-    logger.info(f"Fitting request for type: {type}")
-    content = await data.read()
+) -> HistoryPage:
+    """
+    Predictions of the user, newest first, limit per page. The next page is
+    requested with next_cursor of the previous one; the cursor is the sort
+    key of the last returned row, so every page is an index range scan of
+    predicts_owner_date_idx however long the history is.
+    """
+    logger.info(f"History page request from user: {login}")
+    if cursor is None:
+        predicts = await db.fetch(
+            """
+            SELECT id, predict_date FROM classification_reviews.predicts
+            WHERE owner = $1
+            ORDER BY predict_date DESC, id DESC
+            LIMIT $2
+            """,
+            login, limit + 1)
+    else:
+        try:
+            predict_date, predict_id = pagination.history_cursor(cursor)
+        except pagination.InvalidCursor as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        predicts = await db.fetch(
+            """
+            SELECT id, predict_date FROM classification_reviews.predicts
+            WHERE owner = $1 AND (predict_date, id) < ($2, $3)
+            ORDER BY predict_date DESC, id DESC
+            LIMIT $4
+            """,
+            login, predict_date, predict_id, limit + 1)
+    predicts, has_more = pagination.split_page(predicts, limit)
+    return HistoryPage(
+        items=[(predict["id"], predict["predict_date"]) for predict in predicts],
+        next_cursor=pagination.next_history_cursor(predicts, has_more))
+
+
+class ReviewsPage(BaseModel):
+    # predict_id, row number in the result file, label, review
+    items: List[Tuple[int, int, str, str]]
+    next_cursor: Optional[str] = None
+
+
+@app.post("/get_reviews")
+async def get_reviews(
+    login: Annotated[str, Depends(authenticated_login)],
+    label: Annotated[Optional[str], Form()] = None,
+    predict_id: Annotated[Optional[List[int]], Form()] = None,
+    limit: PageLimit = constants.PAGE_SIZE,
+    cursor: Annotated[Optional[str], Form()] = None,
+    db=Depends(get_connection)
+) -> ReviewsPage:
+    """
+    Scored reviews of the user stored with STORE_REVIEW_ROWS, newest first,
+    optionally only those with the given label and of the given predictions
+    (predict_id may be repeated). Paginated like /get_history_page.
+    """
+    if not constants.STORE_REVIEW_ROWS:
+        raise HTTPException(status_code=404, detail="Review storage is disabled")
+    logger.info(f"Reviews request from user {login}: label {label}, predictions {predict_id}")
     try:
-        match type:
-            case "csv":
-                data = pd.read_csv(BytesIO(content))
-                if "Review" not in data.columns or "Sentiment" not in data.columns:
-                    logger.warning(
-                        "CSV file missing required columns: Review and/or Sentiment")
-                    raise HTTPException(
-                        status_code=400,
-                        detail="CSV file must contain 'Review' and 'Sentiment' columns")
-                model_user = await logreg_fit(data)
-                logger.info("User model fitted successfully from input data")
-            case "pkl":
-                model_user = pickle.loads(content)
-                logger.info("User model loaded successfully from pkl file")
-            case _:
-                logger.warning(f"Invalid data type: {type}")
-                raise HTTPException(
-                    status_code=404, detail="Data type not found")
-    except Exception as e:
-        logger.error(f"Error reading {type} file: {str(e)}")
+        after = pagination.reviews_cursor(cursor) if cursor is not None else None
+    except pagination.InvalidCursor as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    query, params = reviews_query(label, predict_id, after)
+    with stage("query_rows"):
+        rows = await db.fetch(query, login, *params, limit + 1)
+    rows, has_more = pagination.split_page(rows, limit)
+    return ReviewsPage(
+        items=[(row["predict_id"], row["row_number"], row["label"], row["review"])
+               for row in rows],
+        next_cursor=pagination.next_reviews_cursor(rows, has_more))
+
+
+@app.post("/get_summary")
+async def get_summary(
+    login: Annotated[str, Depends(authenticated_login)],
+    predict_id: Annotated[int, Form()],
+    db=Depends(get_connection)
+) -> dict:
+    """
+    Summary saved with a prediction: rows, class counts and top terms and
+    bigrams per class, the figures the dashboard shows without downloading
+    the result file.
+    """
+    logger.info(f"Summary request from user {login} for predict_id {predict_id}")
+    predict = await db.fetchrow(
+        """
+        SELECT summary FROM classification_reviews.predicts
+        WHERE id = $1 AND owner = $2
+        """,
+        predict_id, login)
+    if predict is None:
+        raise HTTPException(status_code=404, detail="Prediction not found")
+    if predict["summary"] is None:
+        # Predictions made before summaries were introduced
         raise HTTPException(
-            status_code=400, detail=f"Error reading {type} file: {str(e)}")
+            status_code=404, detail="Summary not available for this prediction")
+    return json.loads(predict["summary"])
 
-    if model_user is None:
-        logger.warning("User model not loaded")
-        raise HTTPException(status_code=400, detail="Failed to load model")
 
+async def register_model(login: str, model_name: str, content: bytes) -> int:
+    """Insert the model row and upload the model, both or neither"""
     query = """
             INSERT INTO classification_reviews.models (owner, model_name) VALUES
             ($1, $2)
             RETURNING id;
             """
-    model_id = await db.fetchval(query, login, model_name)
-    buffer = BytesIO()
-    pickle.dump(model_user, buffer)
-    buffer.seek(0)
+    key = None
+    async with pool.acquire() as db:
+        try:
+            async with db.transaction():
+                with stage("insert"):
+                    model_id = await db.fetchval(query, login, model_name)
+                key = f"{login}_{model_id}.pkl"
+                with stage("upload"):
+                    await storage.upload_bytes(content, key)
+        except Exception as e:
+            logger.error(f"Error saving model of user {login}: {str(e)}")
+            if key is not None:
+                try:
+                    await storage.delete(key)
+                except Exception as delete_error:
+                    logger.error(f"Error deleting {key}: {str(delete_error)}")
+            raise HTTPException(
+                status_code=500, detail=f"Error saving results: {str(e)}")
+    logger.info(f"Model uploaded to S3 for user {login}, model_id {model_id}")
+    return model_id
+
+
+async def run_fit_job(job: Job, progress: Callable[..., None]) -> dict:
+    loop = asyncio.get_running_loop()
+    current_endpoint.set("fit_job")
+    output_path = f"{job.input_path}.model"
+    mode = job.params.get("mode", "standard")
+    options = {
+        "chunk_rows": constants.TRAIN_CHUNK_ROWS,
+        "n_features": constants.TRAIN_HASHING_FEATURES,
+        "budget_seconds": constants.TUNE_BUDGET_SECONDS,
+        "n_jobs": constants.TUNE_JOBS,
+        "feature_cache_dir": constants.FEATURE_CACHE_DIR,
+        "feature_cache_bytes": constants.FEATURE_CACHE_BYTES,
+    }
     try:
-        session = boto3.session.Session()
-        s3 = session.client(
-            service_name="s3",
-            endpoint_url="https://storage.yandexcloud.net",
-            aws_access_key_id=os.getenv("access_key"),
-            aws_secret_access_key=os.getenv("secret_access_key")
-        )
-        s3.upload_fileobj(buffer, "classification.reviews",
-                          f"{login}_{model_id}.pkl")
-        logger.info(
-            f"Model uploaded to S3 for user {login}, model_id {model_id}")
-    except Exception as e:
-        logger.error(f"Error uploading to S3: {str(e)}")
+        with stage("train"):
+            stats = await train_in_process(
+                job.params["data_type"], job.input_path, output_path, progress,
+                mode, options)
+        content = await loop.run_in_executor(None, Path(output_path).read_bytes)
+    finally:
+        Path(output_path).unlink(missing_ok=True)
+    logger.info(
+        f"User model trained by job {job.id} in {mode} mode: {stats['rows']} rows, "
+        f"{stats['rows_per_second']} rows/s")
+    progress(stats["rows"], "registering")
+    model_id = await register_model(
+        job.params["login"], job.params["model_name"], content)
+    return {"model_id": model_id, **stats}
+
+
+async def submit_fit_job(
+        type: str,
+        data: UploadFile,
+        login: str,
+        model_name: str,
+        mode: str
+) -> str:
+    if type not in ("csv", "pkl"):
+        logger.warning(f"Invalid data type: {type}")
+        raise HTTPException(status_code=404, detail="Data type not found")
+    if mode not in TRAINING_MODES:
+        logger.warning(f"Invalid training mode: {mode}")
+        raise HTTPException(status_code=422, detail="Training mode not found")
+    if type != "csv" and mode != "standard":
         raise HTTPException(
-            status_code=500, detail=f"Error saving results: {str(e)}")
-    return model_id
+            status_code=422, detail=f"Training mode {mode} requires a csv file")
+    return await fit_jobs.submit(
+        {"login": login, "model_name": model_name, "data_type": type,
+         "mode": mode},
+        data.file)
+
+
+@app.post("/fit/{type}")
+@instrument("fit")
+async def fit(
+    type: str,
+    data: Annotated[UploadFile, File()],
+    login: Annotated[str, Depends(authenticated_login)],
+    model_name: Annotated[str, Form()],
+    mode: Annotated[str, Form()] = "standard"
+) -> int:
+    logger.info(f"Fitting request for type: {type}, mode: {mode}")
+    job_id = await submit_fit_job(type, data, login, model_name, mode)
+    with stage("wait_job"):
+        job = await fit_jobs.wait(job_id)
+    match job.state:
+        case "done":
+            return job.result["model_id"]
+        case "cancelled":
+            raise HTTPException(status_code=409, detail="Training cancelled")
+        case _:
+            logger.error(f"Fitting failed: {job.error}")
+            raise HTTPException(status_code=400, detail=job.error)
+
+
+@app.post("/jobs/fit/{type}")
+async def submit_fit(
+    type: str,
+    data: Annotated[UploadFile, File()],
+    login: Annotated[str, Depends(authenticated_login)],
+    model_name: Annotated[str, Form()],
+    mode: Annotated[str, Form()] = "standard"
+) -> dict:
+    logger.info(f"Fitting job from user {login} for type: {type}, mode: {mode}")
+    job_id = await submit_fit_job(type, data, login, model_name, mode)
+    return {"job_id": job_id}
 
 
 @app.post("/get_models")
 async def get_models(
-    login: Annotated[str, Form()],
+    login: Annotated[str, Depends(authenticated_login)],
     db=Depends(get_connection)
 ) -> List[Tuple[int, str]]:
     logger.info(f"Models request from user: {login}")
-    user = await db.fetchrow("Select * from classification_reviews.users where login = $1", login)
-    if user is None:
-        logger.warning(f"Models request failed - user {login} not found")
-        raise HTTPException(status_code=404, detail="Login not found")
-
     query = """
             SELECT id, model_name FROM classification_reviews.models
             WHERE owner = $1
@@ -472,6 +1272,43 @@ async def get_models(
     return [(model["id"], model["model_name"]) for model in models]
 
 
+@app.post("/get_models_page")
+async def get_models_page(
+    login: Annotated[str, Depends(authenticated_login)],
+    limit: PageLimit = constants.PAGE_SIZE,
+    cursor: Annotated[Optional[str], Form()] = None,
+    db=Depends(get_connection)
+) -> ModelsPage:
+    """Models of the user, newest first, paginated like /get_history_page"""
+    logger.info(f"Models page request from user: {login}")
+    if cursor is None:
+        models = await db.fetch(
+            """
+            SELECT id, model_name FROM classification_reviews.models
+            WHERE owner = $1
+            ORDER BY id DESC
+            LIMIT $2
+            """,
+            login, limit + 1)
+    else:
+        try:
+            model_id = pagination.models_cursor(cursor)
+        except pagination.InvalidCursor as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        models = await db.fetch(
+            """
+            SELECT id, model_name FROM classification_reviews.models
+            WHERE owner = $1 AND id < $2
+            ORDER BY id DESC
+            LIMIT $3
+            """,
+            login, model_id, limit + 1)
+    models, has_more = pagination.split_page(models, limit)
+    return ModelsPage(
+        items=[(model["id"], model["model_name"]) for model in models],
+        next_cursor=pagination.next_models_cursor(models, has_more))
+
+
 if __name__ == "__main__":
     logger.info("Starting server")
     uvicorn.run(app, host=constants.IP, port=constants.PORT)
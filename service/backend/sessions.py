@@ -0,0 +1,130 @@
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+TOKEN_VERSION = "v1"
+
+
+def _encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def _decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode((data + "=" * (-len(data) % 4)).encode())
+
+
+def session_secret(configured: str, private_key_pem: Optional[str]) -> bytes:
+    """
+    Signing key of session tokens: SESSION_SECRET when set, otherwise
+    derived from the RSA private key, so every server process verifies the
+    tokens of the others without extra configuration. Without either, a
+    random key is used and tokens only work with the process that issued
+    them.
+    """
+    if configured:
+        return configured.encode()
+    if private_key_pem:
+        return hashlib.sha256(b"session-secret\0" + private_key_pem.encode()).digest()
+    logger.warning("Neither SESSION_SECRET nor PRIVATE_KEY is set, "
+                   "session tokens are valid only in this process")
+    return os.urandom(32)
+
+
+class SessionSigner:
+    """
+    Issues and verifies stateless session tokens.
+
+    A token is "v1.<payload>.<signature>": the base64url JSON payload with
+    the login and the expiry time, and its HMAC-SHA256. Verification is a
+    hash of the payload, so authenticated requests need neither the
+    database nor RSA.
+
+    Args:
+        secret: HMAC key shared by all server processes
+        ttl: seconds a token stays valid
+    """
+
+    def __init__(self, secret: bytes, ttl: int):
+        self._secret = secret
+        self.ttl = ttl
+
+    def _sign(self, payload: str) -> str:
+        message = f"{TOKEN_VERSION}.{payload}".encode()
+        return _encode(hmac.new(self._secret, message, hashlib.sha256).digest())
+
+    def issue(self, login: str) -> str:
+        payload = _encode(json.dumps(
+            {"sub": login, "exp": int(time.time()) + self.ttl},
+            separators=(",", ":")).encode())
+        return f"{TOKEN_VERSION}.{payload}.{self._sign(payload)}"
+
+    def verify(self, token: str) -> Optional[str]:
+        """
+        Returns:
+            Optional[str]: login of a valid token, None for a forged,
+                malformed or expired one
+        """
+        try:
+            version, payload, signature = token.split(".")
+        except ValueError:
+            return None
+        if version != TOKEN_VERSION \
+                or not hmac.compare_digest(signature, self._sign(payload)):
+            return None
+        try:
+            claims = json.loads(_decode(payload))
+            login, expires = claims["sub"], claims["exp"]
+        except (ValueError, KeyError, TypeError):
+            return None
+        if not isinstance(login, str) or not isinstance(expires, int) \
+                or expires <= time.time():
+            return None
+        return login
+
+
+class PasswordDigests:
+    """
+    LRU map from a stored encrypted password to a keyed digest of its
+    plaintext, so a login decrypts only the submitted password. Keys are
+    digests of the stored ciphertext: a changed password is a new key.
+
+    Args:
+        secret: HMAC key, plaintext digests are useless without it
+        max_entries: cached passwords after which the least recently used
+            ones are dropped
+    """
+
+    def __init__(self, secret: bytes, max_entries: int):
+        self._secret = secret
+        self.max_entries = max_entries
+        self._entries: OrderedDict[bytes, bytes] = OrderedDict()
+
+    def digest(self, password: bytes) -> bytes:
+        return hmac.new(self._secret, password, hashlib.sha256).digest()
+
+    def get(self, stored: bytes) -> Optional[bytes]:
+        key = hashlib.sha256(stored).digest()
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def put(self, stored: bytes, password: bytes):
+        self._entries[hashlib.sha256(stored).digest()] = self.digest(password)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def matches(self, stored: bytes, password: bytes) -> Optional[bool]:
+        """Compare with the cached digest, None when stored isn't cached"""
+        cached = self.get(stored)
+        if cached is None:
+            return None
+        return hmac.compare_digest(cached, self.digest(password))
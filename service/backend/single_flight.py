@@ -0,0 +1,45 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+def _retrieve_exception(task: asyncio.Task):
+    # Every caller may have been cancelled, mark the exception as retrieved
+    if not task.cancelled():
+        task.exception()
+
+
+class SingleFlight:
+    """
+    Concurrent calls for the same key share one run of their coroutine.
+
+    The run is a task of its own, so a cancelled caller doesn't cancel it
+    for the others, and the key is released as soon as the run finishes.
+    """
+
+    def __init__(self):
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._tasks
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Args:
+            key: identity of the work, e.g. a cache key
+            factory: coroutine factory, called only when no run of key is
+                in progress
+        Returns:
+            Any: result of the run in progress or of a new one
+        """
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.create_task(self._run(key, factory))
+            task.add_done_callback(_retrieve_exception)
+            self._tasks[key] = task
+        return await asyncio.shield(task)
+
+    async def _run(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            return await factory()
+        finally:
+            del self._tasks[key]
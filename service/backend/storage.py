@@ -0,0 +1,301 @@
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from typing import Any, BinaryIO, List, Optional
+
+import boto3
+from botocore.config import Config
+
+import constants
+
+logger = logging.getLogger(__name__)
+
+
+class ObjectStorage(ABC):
+    """
+    Base class of object storage backends.
+
+    Blocking calls of the backend run on a bounded thread pool, so the
+    async methods never block the event loop. submitted and finished count
+    the calls handed to the pool and the ones it has returned.
+
+    Args:
+        max_workers: size of the thread pool for blocking I/O
+    """
+
+    def __init__(self, max_workers: int):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="storage")
+        self.submitted = 0
+        self.finished = 0
+
+    def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor, func, *args)
+        self.submitted += 1
+        future.add_done_callback(self._finish)
+        return future
+
+    def _finish(self, _: asyncio.Future):
+        self.finished += 1
+
+    async def upload_fileobj(self, fileobj: BinaryIO, key: str):
+        await self._run(self._upload_fileobj, fileobj, key)
+
+    async def upload_bytes(self, content: bytes, key: str):
+        await self._run(self._upload_fileobj, BytesIO(content), key)
+
+    async def download(self, key: str) -> bytes:
+        return await self._run(self._download, key)
+
+    async def delete(self, key: str):
+        await self._run(self._delete, key)
+
+    def multipart_upload(self, key: str, part_size: int) -> "MultipartUpload":
+        return MultipartUpload(self, key, part_size)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    @abstractmethod
+    def _upload_fileobj(self, fileobj: BinaryIO, key: str):
+        ...
+
+    @abstractmethod
+    def _download(self, key: str) -> bytes:
+        ...
+
+    @abstractmethod
+    def _delete(self, key: str):
+        ...
+
+    @abstractmethod
+    def _create_multipart(self, key: str) -> Any:
+        ...
+
+    @abstractmethod
+    def _upload_part(self, handle: Any, number: int, content: bytes) -> Any:
+        ...
+
+    @abstractmethod
+    def _complete_multipart(self, handle: Any, parts: List[Any]):
+        ...
+
+    @abstractmethod
+    def _abort_multipart(self, handle: Any):
+        ...
+
+
+class MultipartUpload:
+    """
+    Incremental upload of one object in parts of at least part_size bytes.
+
+    Only one part is buffered in memory at a time. A blocking call which
+    was cancelled still runs in its thread, so abort() waits for it before
+    it removes what the upload wrote.
+    """
+
+    def __init__(self, storage: ObjectStorage, key: str, part_size: int):
+        self.key = key
+        self.size = 0
+        self._storage = storage
+        self._part_size = part_size
+        self._buffer = bytearray()
+        self._parts = []
+        self._handle = None
+        self._completed = False
+        self._inflight: Optional[asyncio.Future] = None
+
+    async def write(self, content: bytes):
+        self._buffer += content
+        self.size += len(content)
+        if len(self._buffer) >= self._part_size:
+            await self._flush()
+
+    async def complete(self):
+        if self._buffer or not self._parts:
+            await self._flush()
+        await self._call(self._complete)
+        logger.info(
+            f"Multipart upload of {self.key} completed: "
+            f"{len(self._parts)} parts, {self.size} bytes")
+
+    async def abort(self):
+        if self._inflight is not None:
+            await asyncio.gather(self._inflight, return_exceptions=True)
+        if self._completed:
+            await self._storage._run(self._storage._delete, self.key)
+        elif self._handle is not None:
+            await self._storage._run(
+                self._storage._abort_multipart, self._handle)
+        self._handle = None
+        logger.warning(f"Multipart upload of {self.key} aborted")
+
+    async def _call(self, func, *args):
+        self._inflight = self._storage._run(func, *args)
+        return await asyncio.shield(self._inflight)
+
+    # Run in the storage threads, their state is set even if the caller
+    # was cancelled meanwhile
+    def _create(self):
+        self._handle = self._storage._create_multipart(self.key)
+
+    def _complete(self):
+        self._storage._complete_multipart(self._handle, self._parts)
+        self._completed = True
+
+    async def _flush(self):
+        if self._handle is None:
+            await self._call(self._create)
+        content = bytes(self._buffer)
+        self._buffer.clear()
+        part = await self._call(
+            self._storage._upload_part,
+            self._handle, len(self._parts) + 1, content)
+        self._parts.append(part)
+
+
+class S3Storage(ObjectStorage):
+    """
+    S3-compatible storage (Yandex Object Storage) with one shared client.
+
+    boto3 clients are thread-safe, so a single client with a connection
+    pool sized to the executor serves every request.
+    """
+
+    def __init__(
+            self,
+            bucket: str,
+            endpoint_url: str,
+            max_workers: int,
+            max_pool_connections: int
+    ):
+        super().__init__(max_workers)
+        self.bucket = bucket
+        session = boto3.session.Session()
+        self._client = session.client(
+            service_name="s3",
+            endpoint_url=endpoint_url,
+            aws_access_key_id=os.getenv("access_key"),
+            aws_secret_access_key=os.getenv("secret_access_key"),
+            config=Config(
+                max_pool_connections=max_pool_connections,
+                tcp_keepalive=True,
+                connect_timeout=5,
+                read_timeout=60,
+                retries={"max_attempts": 3, "mode": "standard"},
+            )
+        )
+
+    def _upload_fileobj(self, fileobj: BinaryIO, key: str):
+        self._client.upload_fileobj(fileobj, self.bucket, key)
+
+    def _download(self, key: str) -> bytes:
+        buffer = BytesIO()
+        self._client.download_fileobj(self.bucket, key, buffer)
+        return buffer.getvalue()
+
+    def _delete(self, key: str):
+        self._client.delete_object(Bucket=self.bucket, Key=key)
+
+    def _create_multipart(self, key: str) -> Any:
+        response = self._client.create_multipart_upload(
+            Bucket=self.bucket, Key=key)
+        return key, response["UploadId"]
+
+    def _upload_part(self, handle: Any, number: int, content: bytes) -> Any:
+        key, upload_id = handle
+        response = self._client.upload_part(
+            Bucket=self.bucket, Key=key, UploadId=upload_id,
+            PartNumber=number, Body=content)
+        return {"ETag": response["ETag"], "PartNumber": number}
+
+    def _complete_multipart(self, handle: Any, parts: List[Any]):
+        key, upload_id = handle
+        self._client.complete_multipart_upload(
+            Bucket=self.bucket, Key=key, UploadId=upload_id,
+            MultipartUpload={"Parts": parts})
+
+    def _abort_multipart(self, handle: Any):
+        key, upload_id = handle
+        self._client.abort_multipart_upload(
+            Bucket=self.bucket, Key=key, UploadId=upload_id)
+
+
+class LocalStorage(ObjectStorage):
+    """Filesystem storage for local runs, tests and benchmarks"""
+
+    def __init__(self, root: str, max_workers: int):
+        super().__init__(max_workers)
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        path = (self.root / key).resolve()
+        if self.root.resolve() not in path.parents:
+            raise ValueError(f"Invalid object key: {key}")
+        return path
+
+    def _upload_fileobj(self, fileobj: BinaryIO, key: str):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as tmp:
+            shutil.copyfileobj(fileobj, tmp)
+        os.replace(tmp.name, path)
+
+    def _download(self, key: str) -> bytes:
+        try:
+            return self._path(key).read_bytes()
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Object {key} not found") from None
+
+    def _delete(self, key: str):
+        self._path(key).unlink(missing_ok=True)
+
+    def _create_multipart(self, key: str) -> Any:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = tempfile.NamedTemporaryFile(dir=path.parent, delete=False)
+        return path, tmp
+
+    def _upload_part(self, handle: Any, number: int, content: bytes) -> Any:
+        _, tmp = handle
+        tmp.write(content)
+        return number
+
+    def _complete_multipart(self, handle: Any, parts: List[Any]):
+        path, tmp = handle
+        tmp.close()
+        os.replace(tmp.name, path)
+
+    def _abort_multipart(self, handle: Any):
+        _, tmp = handle
+        tmp.close()
+        os.unlink(tmp.name)
+
+
+def create_storage() -> ObjectStorage:
+    match constants.STORAGE_BACKEND:
+        case "s3":
+            storage = S3Storage(
+                bucket=constants.BUCKET,
+                endpoint_url=constants.S3_ENDPOINT,
+                max_workers=constants.STORAGE_MAX_WORKERS,
+                max_pool_connections=constants.STORAGE_MAX_WORKERS,
+            )
+        case "local":
+            storage = LocalStorage(
+                root=constants.STORAGE_LOCAL_DIR,
+                max_workers=constants.STORAGE_MAX_WORKERS,
+            )
+        case _:
+            raise ValueError(
+                f"Unknown storage backend: {constants.STORAGE_BACKEND}")
+    logger.info(f"Object storage backend: {constants.STORAGE_BACKEND}")
+    return storage
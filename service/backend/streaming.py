@@ -0,0 +1,70 @@
+import asyncio
+from functools import partial
+from typing import Awaitable, BinaryIO, Callable, Optional
+
+import numpy as np
+import pandas as pd
+from fastapi import HTTPException
+
+import profiling
+from metrics import stage
+from storage import MultipartUpload
+from summary import SummaryBuilder
+
+
+async def stream_predict_csv(
+        fileobj: BinaryIO,
+        predict: Callable[[pd.Series], Awaitable[np.ndarray]],
+        upload: MultipartUpload,
+        chunk_rows: int,
+        on_chunk: Optional[Callable[[int], None]] = None,
+        summary: Optional[SummaryBuilder] = None,
+        on_scored: Optional[Callable[[pd.DataFrame, int], Awaitable]] = None
+) -> int:
+    """
+    Args:
+        fileobj: CSV file with a Review column
+        predict: coroutine function returning labels for a chunk of reviews
+        upload: multipart upload receiving the CSV with predictions
+        chunk_rows: number of rows parsed and scored at once
+        on_chunk: called with the total number of scored rows after each chunk
+        summary: updated with the reviews and labels of every chunk
+        on_scored: awaited with every scored chunk and the number of rows
+            before it
+    Raises:
+        HTTPException: the Review column is missing
+    Returns:
+        int: number of scored rows
+    """
+    loop = asyncio.get_running_loop()
+    reader = await loop.run_in_executor(
+        None, profiling.wrap(partial(pd.read_csv, fileobj, chunksize=chunk_rows)))
+    rows = 0
+    with reader:
+        while True:
+            with stage("read_csv"):
+                chunk = await loop.run_in_executor(
+                    None, profiling.wrap(next), reader, None)
+            if chunk is None:
+                break
+            if "Review" not in chunk.columns:
+                raise HTTPException(
+                    status_code=422, detail="Review column not found")
+            chunk["predict"] = await predict(chunk["Review"].apply(str))
+            if summary is not None:
+                with stage("summarize"):
+                    await loop.run_in_executor(
+                        None, profiling.wrap(summary.update),
+                        chunk["Review"], chunk["predict"].to_numpy())
+            if on_scored is not None:
+                await on_scored(chunk, rows)
+            with stage("serialize"):
+                to_csv = partial(chunk.to_csv, index=False, header=rows == 0)
+                content = await loop.run_in_executor(
+                    None, profiling.wrap(to_csv))
+            with stage("upload"):
+                await upload.write(content.encode())
+            rows += len(chunk)
+            if on_chunk is not None:
+                on_chunk(rows)
+    return rows
@@ -0,0 +1,137 @@
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+import pandas as pd
+from stop_words import get_stop_words
+
+# Same cleanup and stop words as the Streamlit dashboard
+PUNCTUATION = re.compile(r"[^\w\s]")
+STOPWORDS_RU = frozenset(get_stop_words("russian"))
+# Put between the reviews of a class before they are split at once; not
+# whitespace, so it becomes a word of its own which ends every bigram
+SEPARATOR = "\x00"
+
+
+def preprocess_text(text) -> str:
+    if not isinstance(text, str):
+        return ""
+    return PUNCTUATION.sub("", text.lower())
+
+
+def count_words(texts: List, limit: int) -> Tuple[pd.Series, pd.Series]:
+    """
+    Term and bigram counts of texts, the limit most frequent of each.
+
+    The texts are split into words in one go and the words are replaced by
+    integer codes. Terms are the distinct words cleaned and merged, which
+    equals cleaning every text first since the cleanup never touches
+    whitespace. Bigrams are counted as pairs of adjacent codes.
+
+    Returns:
+        Tuple[pd.Series, pd.Series]: counts of terms and of bigrams,
+            indexed by the term and by "first second"
+    """
+    words = f" {SEPARATOR} ".join(
+        text if isinstance(text, str) else "" for text in texts).split()
+    codes, uniques = pd.factorize(np.array(words, dtype=object))
+    uniques = np.asarray(uniques, dtype=object)
+
+    terms = pd.Series(
+        np.bincount(codes, minlength=len(uniques)),
+        index=[preprocess_text(word) for word in uniques])
+    terms = terms.groupby(level=0, sort=False).sum()
+    terms = terms.drop(["", *STOPWORDS_RU], errors="ignore")
+    if len(terms) > limit:
+        terms = terms.nlargest(limit)
+
+    # -1 when there is a single text, no code matches it then
+    separator = pd.Index(uniques).get_indexer([SEPARATOR])[0]
+    within = (codes[:-1] != separator) & (codes[1:] != separator)
+    pairs = codes[:-1][within].astype(np.int64) * len(uniques) + codes[1:][within]
+    pairs, counts = np.unique(pairs, return_counts=True)
+    if len(pairs) > limit:
+        top = np.argpartition(counts, -limit)[-limit:]
+        pairs, counts = pairs[top], counts[top]
+    first, second = np.divmod(pairs, len(uniques))
+    bigrams = pd.Series(counts, index=uniques[first] + " " + uniques[second])
+    return terms, bigrams
+
+
+class SummaryBuilder:
+    """
+    Incremental summary of a prediction: row count, class counts and the
+    most frequent terms and bigrams of every class, computed the way the
+    Streamlit dashboard does it from the result file. Terms are lowercased
+    words without punctuation and stop words, bigrams are pairs of
+    whitespace-separated words of the raw review.
+
+    Chunks of a streamed prediction are added one by one. Counts of a
+    class are pruned to their most frequent keys when they outgrow
+    max_keys, so memory stays bounded on huge files and the top lists are
+    exact unless a term is spread thinly over many chunks.
+
+    Args:
+        top_n: terms and bigrams kept per class in the summary
+        max_keys: distinct terms or bigrams counted per class
+    """
+
+    def __init__(self, top_n: int = 10, max_keys: int = 100_000):
+        self.top_n = top_n
+        self.max_keys = max_keys
+        self.rows = 0
+        self.classes: Counter = Counter()
+        self.terms: Dict[str, pd.Series] = {}
+        self.bigrams: Dict[str, pd.Series] = {}
+
+    def update(self, reviews: pd.Series, labels: Iterable):
+        labels = np.asarray(labels)
+        texts = np.asarray(reviews, dtype=object)
+        self.rows += len(labels)
+        for label in np.unique(labels):
+            key = str(label.item() if isinstance(label, np.generic) else label)
+            selected = texts[labels == label]
+            self.classes[key] += len(selected)
+            terms, bigrams = count_words(selected.tolist(), self.max_keys)
+            self.terms[key] = self._merge(self.terms.get(key), terms)
+            self.bigrams[key] = self._merge(self.bigrams.get(key), bigrams)
+
+    def _merge(self, total: pd.Series, counts: pd.Series) -> pd.Series:
+        if total is not None:
+            counts = pd.concat([total, counts]).groupby(level=0, sort=False).sum()
+        if len(counts) > self.max_keys:
+            counts = counts.nlargest(self.max_keys // 2)
+        return counts
+
+    def _top(self, counts: Dict[str, pd.Series]) -> Dict[str, List[list]]:
+        top = {}
+        for key, series in counts.items():
+            # Ties are ordered by the item, so chunking doesn't change the result
+            items = sorted(series.nlargest(self.top_n, keep="all").items(),
+                           key=lambda item: (-item[1], item[0]))
+            top[key] = [[item, int(count)] for item, count in items[:self.top_n]]
+        return top
+
+    def result(self) -> dict:
+        return {
+            "rows": self.rows,
+            "classes": dict(self.classes),
+            "top_terms": self._top(self.terms),
+            "top_bigrams": self._top(self.bigrams),
+        }
+
+
+def summarize(
+        reviews: pd.Series,
+        labels: Iterable,
+        top_n: int = 10,
+        chunk_rows: int = 50_000
+) -> dict:
+    """Summary of a whole frame, counted chunk_rows reviews at a time"""
+    builder = SummaryBuilder(top_n)
+    labels = np.asarray(labels)
+    for start in range(0, len(labels), chunk_rows):
+        builder.update(reviews.iloc[start:start + chunk_rows],
+                       labels[start:start + chunk_rows])
+    return builder.result()
@@ -0,0 +1,259 @@
+import asyncio
+import multiprocessing
+import os
+import pickle
+import time
+from multiprocessing.connection import Connection
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+from sklearn.pipeline import Pipeline
+
+from feature_cache import FeatureCache, config_key, file_digest
+from tuning import tune_logreg
+
+# How often the server checks the training process for messages
+POLL_INTERVAL = 0.2
+# "standard" fits TF-IDF + LogisticRegression in memory, "streaming" fits a
+# hashing featurizer + SGD logistic regression chunk by chunk, "tuned"
+# searches TF-IDF + LogisticRegression settings before fitting
+TRAINING_MODES = ("standard", "streaming", "tuned")
+
+
+class TrainingError(Exception):
+    """The uploaded data can't be turned into a model"""
+
+
+def logreg_pipeline() -> Pipeline:
+    return Pipeline([
+        ('tf', TfidfVectorizer()),
+        ('clf', LogisticRegression(random_state=42))
+    ])
+
+
+def check_columns(columns: pd.Index):
+    if "Review" not in columns or "Sentiment" not in columns:
+        raise TrainingError(
+            "CSV file must contain 'Review' and 'Sentiment' columns")
+
+
+def fit_standard(
+        input_path: str,
+        cache: Optional[FeatureCache],
+        progress: Callable[[int, str], None]
+) -> Tuple[Pipeline, int, Optional[str]]:
+    """
+    Fit the default TF-IDF + LogisticRegression pipeline, reusing the
+    vectorized dataset and the fitted classifier when the same file was
+    trained on before.
+
+    Returns:
+        Tuple[Pipeline, int, Optional[str]]: fitted pipeline, number of rows
+            and what came from the cache: "model", "features", "miss" or
+            None when the cache is off
+    """
+    template = logreg_pipeline()
+    vectorizer, classifier = template.named_steps["tf"], template.named_steps["clf"]
+    vectorizer_key = config_key(**vectorizer.get_params())
+    classifier_key = config_key(**classifier.get_params())
+    dataset = file_digest(input_path) if cache is not None else None
+
+    cached = cache.load(dataset, vectorizer_key) if cache is not None else None
+    if cached is None:
+        data = pd.read_csv(input_path)
+        check_columns(data.columns)
+        progress(len(data), "vectorizing")
+        matrix = vectorizer.fit_transform(data["Review"].apply(str))
+        labels = data["Sentiment"].to_numpy()
+        if cache is not None:
+            cache.store(dataset, vectorizer_key, vectorizer, matrix, labels)
+        status = "miss" if cache is not None else None
+    else:
+        vectorizer, matrix, labels = cached
+        status = "features"
+
+    fitted = cache.load_model(dataset, vectorizer_key, classifier_key) \
+        if cached is not None else None
+    if fitted is None:
+        progress(len(labels), "fitting")
+        fitted = classifier.fit(matrix, labels)
+        if cache is not None:
+            cache.store_model(dataset, vectorizer_key, classifier_key, fitted)
+    else:
+        status = "model"
+    return Pipeline([('tf', vectorizer), ('clf', fitted)]), len(labels), status
+
+
+def fit_streaming(
+        input_path: str,
+        chunk_rows: int,
+        n_features: int,
+        progress: Callable[[int, str], None]
+) -> Pipeline:
+    """
+    Fit a HashingVectorizer + SGDClassifier(log_loss) pipeline reading the
+    CSV twice in chunks, so memory is bounded by the chunk size and not by
+    the dataset. The first pass reads only the labels to learn the classes
+    which partial_fit needs up front.
+    """
+    check_columns(pd.read_csv(input_path, nrows=0).columns)
+    labels = []
+    with pd.read_csv(input_path, usecols=["Sentiment"], chunksize=chunk_rows) as reader:
+        for chunk in reader:
+            labels.append(np.unique(chunk["Sentiment"].dropna()))
+    classes = np.unique(np.concatenate(labels)) if labels else np.array([])
+    if len(classes) < 2:
+        raise TrainingError("Training data must contain at least two classes")
+
+    vectorizer = HashingVectorizer(n_features=n_features, alternate_sign=False)
+    classifier = SGDClassifier(loss="log_loss", random_state=42)
+    rows = 0
+    with pd.read_csv(input_path, usecols=["Review", "Sentiment"],
+                     chunksize=chunk_rows) as reader:
+        for chunk in reader:
+            chunk = chunk.dropna(subset=["Sentiment"])
+            if chunk.empty:
+                continue
+            classifier.partial_fit(
+                vectorizer.transform(chunk["Review"].apply(str)),
+                chunk["Sentiment"],
+                classes=classes)
+            rows += len(chunk)
+            progress(rows, "fitting")
+    return Pipeline([('hashing', vectorizer), ('clf', classifier)])
+
+
+def _train(
+        data_type: str,
+        mode: str,
+        input_path: str,
+        output_path: str,
+        options: dict,
+        connection: Connection
+):
+    """Body of the training process, reports progress through connection"""
+    rows = 0
+
+    def progress(value: int, stage: str):
+        nonlocal rows
+        rows = value
+        connection.send(("progress", value, stage))
+
+    cache = None
+    if options.get("feature_cache_dir"):
+        cache = FeatureCache(
+            options["feature_cache_dir"], options["feature_cache_bytes"])
+    cache_status = None
+    try:
+        progress(0, "reading")
+        started = time.perf_counter()
+        match data_type, mode:
+            case "csv", "standard":
+                model, rows, cache_status = fit_standard(input_path, cache, progress)
+            case "csv", "streaming":
+                model = fit_streaming(
+                    input_path, options["chunk_rows"], options["n_features"],
+                    progress)
+            case "csv", "tuned":
+                data = pd.read_csv(input_path)
+                check_columns(data.columns)
+                progress(len(data), "tuning")
+                started = time.perf_counter()
+                model, search = tune_logreg(
+                    data, options["budget_seconds"], options["n_jobs"], progress)
+                rows = len(data)
+            case "pkl", _:
+                with open(input_path, "rb") as file:
+                    model = pickle.load(file)
+                if model is None:
+                    raise TrainingError("Failed to load model")
+            case _:
+                raise TrainingError("Data type not found")
+        seconds = time.perf_counter() - started
+        progress(rows, "saving")
+        with open(f"{output_path}.part", "wb") as file:
+            pickle.dump(model, file)
+        os.replace(f"{output_path}.part", output_path)
+        stats = {
+            "rows": rows,
+            "fit_seconds": round(seconds, 3),
+            "rows_per_second": round(rows / seconds, 1) if seconds > 0 else None,
+        }
+        if cache_status is not None:
+            stats["feature_cache"] = cache_status
+        if mode == "tuned":
+            stats["search"] = search
+        connection.send(("done", stats))
+    except Exception as error:
+        connection.send(("error", f"Error reading {data_type} file: {str(error)}"))
+    finally:
+        connection.close()
+
+
+async def train_in_process(
+        data_type: str,
+        input_path: str,
+        output_path: str,
+        progress: Optional[Callable[[int, str], None]] = None,
+        mode: str = "standard",
+        options: Optional[dict] = None
+) -> dict:
+    """
+    Train a model from an uploaded file in a separate process, so neither
+    the event loop nor the GIL of the server is held by fitting. Cancelling
+    the coroutine terminates the process.
+
+    Args:
+        data_type: "csv" with Review and Sentiment columns or "pkl" with a
+            ready model
+        input_path: uploaded file
+        output_path: where the pickled model is written
+        progress: called with the number of rows and the current stage
+        mode: one of TRAINING_MODES, only "standard" applies to pkl
+        options: settings of the modes, chunk_rows and n_features for
+            "streaming", budget_seconds and n_jobs for "tuned",
+            feature_cache_dir and feature_cache_bytes for "standard"
+    Raises:
+        TrainingError: the data is invalid or training failed
+    Returns:
+        dict: number of training rows, fitting time and rows per second
+    """
+    # Forked like the inference workers: spawn would re-import the server
+    # module in every training process
+    context = multiprocessing.get_context("fork")
+    receiver, sender = context.Pipe(duplex=False)
+    # Not a daemon, the tuned mode starts its own worker processes
+    process = context.Process(
+        target=_train,
+        args=(data_type, mode, input_path, output_path, options or {}, sender)
+    )
+    process.start()
+    sender.close()
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            if not receiver.poll():
+                await asyncio.sleep(POLL_INTERVAL)
+                continue
+            try:
+                message = receiver.recv()
+            except EOFError:
+                await loop.run_in_executor(None, process.join)
+                raise TrainingError(
+                    f"Training process exited with code {process.exitcode}")
+            match message:
+                case ("progress", rows, stage):
+                    if progress is not None:
+                        progress(rows, stage)
+                case ("error", detail):
+                    raise TrainingError(detail)
+                case ("done", stats):
+                    return stats
+    finally:
+        if process.is_alive():
+            process.terminate()
+        await loop.run_in_executor(None, process.join)
+        receiver.close()
@@ -0,0 +1,203 @@
+import itertools
+import math
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import f1_score
+from sklearn.model_selection import train_test_split
+from sklearn.pipeline import Pipeline
+
+# Search space of the tuned mode, the same knobs the baselines were tuned on
+VECTORIZER_GRID = {
+    "ngram_range": [(1, 1), (1, 2)],
+    "min_df": [1, 2],
+    "sublinear_tf": [False, True],
+}
+CLASSIFIER_GRID = {
+    "C": [0.3, 1.0, 3.0, 10.0],
+}
+# Share of candidates dropped after every round and rows of the first round
+HALVING_FACTOR = 3
+MIN_ROUND_ROWS = 500
+VALIDATION_SHARE = 0.2
+MAX_ITER = 1000
+
+
+class NgramAnalyzer:
+    """
+    Analyzer building word n-grams from already tokenized text, the same
+    way TfidfVectorizer does it from raw text
+    """
+
+    def __init__(self, ngram_range: Tuple[int, int]):
+        self.ngram_range = ngram_range
+
+    def __call__(self, tokens: List[str]) -> List[str]:
+        low, high = self.ngram_range
+        if high == 1:
+            return tokens
+        grams = list(tokens) if low == 1 else []
+        for n in range(max(low, 2), high + 1):
+            grams.extend(
+                " ".join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+        return grams
+
+
+def candidates() -> List[dict]:
+    grid = {**VECTORIZER_GRID, **CLASSIFIER_GRID}
+    return [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+
+
+def vectorizer_key(params: dict) -> tuple:
+    return tuple(params[name] for name in VECTORIZER_GRID)
+
+
+def tokenize(reviews: pd.Series) -> List[List[str]]:
+    """Run the default preprocessing and tokenization once for all candidates"""
+    vectorizer = TfidfVectorizer()
+    preprocess = vectorizer.build_preprocessor()
+    split = vectorizer.build_tokenizer()
+    return [split(preprocess(review)) for review in reviews]
+
+
+def _score(X_train, y_train, X_valid, y_valid, C: float) -> float:
+    classifier = LogisticRegression(C=C, random_state=42, max_iter=MAX_ITER)
+    classifier.fit(X_train, y_train)
+    return float(f1_score(y_valid, classifier.predict(X_valid), average="macro"))
+
+
+def build_pipeline(params: dict) -> Pipeline:
+    vectorizer_params = {name: params[name] for name in VECTORIZER_GRID}
+    return Pipeline([
+        ('tf', TfidfVectorizer(**vectorizer_params)),
+        ('clf', LogisticRegression(
+            C=params["C"], random_state=42, max_iter=MAX_ITER))
+    ])
+
+
+def tune_logreg(
+        data: pd.DataFrame,
+        budget_seconds: float,
+        n_jobs: int,
+        progress: Optional[Callable[[int, str], None]] = None
+) -> Tuple[Pipeline, dict]:
+    """
+    Successive-halving search over TF-IDF and LogisticRegression settings.
+
+    Every round scores the remaining candidates on a larger share of the
+    training rows and keeps the best 1/HALVING_FACTOR of them. Candidates
+    are scored by macro F1 on a held-out split and fitted in parallel.
+    Reviews are tokenized once, each round only builds n-grams and
+    matrices from the cached tokens. A round is not started when the
+    previous one suggests it would not fit into the budget; the best
+    candidate is then refitted on all rows as a plain TF-IDF + LR pipeline.
+
+    Args:
+        data: DataFrame with Review and Sentiment columns
+        budget_seconds: wall-clock limit of the search, the final refit
+            comes on top of it
+        n_jobs: parallel fits, -1 for all cores
+        progress: called with the rows of the current round and the stage
+    Returns:
+        Tuple[Pipeline, dict]: refitted best pipeline and the search report
+            with the best parameters and the leaderboard
+    """
+    started = time.perf_counter()
+    data = data.dropna(subset=["Sentiment"])
+    reviews = data["Review"].apply(str).reset_index(drop=True)
+    labels = data["Sentiment"].to_numpy()
+    if len(np.unique(labels)) < 2:
+        raise ValueError("Training data must contain at least two classes")
+    _, counts = np.unique(labels, return_counts=True)
+    train_index, valid_index = train_test_split(
+        np.arange(len(labels)), test_size=VALIDATION_SHARE, random_state=42,
+        stratify=labels if counts.min() >= 2 else None)
+
+    tokens = tokenize(reviews)
+    train_tokens = [tokens[i] for i in train_index]
+    valid_tokens = [tokens[i] for i in valid_index]
+    y_train, y_valid = labels[train_index], labels[valid_index]
+
+    remaining = candidates()
+    n_rounds = math.ceil(math.log(len(remaining), HALVING_FACTOR)) + 1
+    rows = min(len(train_index), max(
+        MIN_ROUND_ROWS, len(train_index) // HALVING_FACTOR ** (n_rounds - 1)))
+    leaderboard = []
+    budget_exhausted = False
+    last_round_seconds = 0.0
+    parallel = Parallel(n_jobs=n_jobs)
+
+    for round_number in range(n_rounds):
+        elapsed = time.perf_counter() - started
+        # Rounds get about HALVING_FACTOR times longer with the same work
+        # split among fewer candidates, skip one that can't finish in time
+        if round_number > 0 and elapsed + last_round_seconds * HALVING_FACTOR \
+                > budget_seconds:
+            budget_exhausted = True
+            break
+        y_round = y_train[:rows]
+        if len(np.unique(y_round)) < 2:
+            # Too few rows for this round, go straight to the next one
+            rows = min(len(train_index), rows * HALVING_FACTOR)
+            continue
+        round_started = time.perf_counter()
+        if progress is not None:
+            progress(rows, f"tuning round {round_number + 1}/{n_rounds}")
+
+        # Fit subsets are nested, the first rows of a shuffled training split
+        matrices: Dict[tuple, tuple] = {}
+        for params in remaining:
+            key = vectorizer_key(params)
+            if key in matrices:
+                continue
+            vectorizer = TfidfVectorizer(
+                analyzer=NgramAnalyzer(params["ngram_range"]),
+                min_df=params["min_df"],
+                sublinear_tf=params["sublinear_tf"])
+            matrices[key] = (
+                vectorizer.fit_transform(train_tokens[:rows]),
+                vectorizer.transform(valid_tokens))
+
+        scores = parallel(
+            delayed(_score)(
+                matrices[vectorizer_key(params)][0], y_round,
+                matrices[vectorizer_key(params)][1], y_valid, params["C"])
+            for params in remaining)
+        ranked = sorted(zip(scores, range(len(remaining))), key=lambda item: -item[0])
+        for score, position in ranked:
+            leaderboard.append({
+                "round": round_number + 1,
+                "rows": rows,
+                "f1_macro": round(score, 5),
+                "params": {**remaining[position],
+                           "ngram_range": list(remaining[position]["ngram_range"])},
+            })
+        keep = max(1, math.ceil(len(remaining) / HALVING_FACTOR))
+        remaining = [remaining[position] for _, position in ranked[:keep]]
+        last_round_seconds = time.perf_counter() - round_started
+        if len(remaining) == 1 or rows >= len(train_index):
+            break
+        rows = min(len(train_index), rows * HALVING_FACTOR)
+
+    best = remaining[0]
+    search_seconds = time.perf_counter() - started
+    if progress is not None:
+        progress(len(labels), "refitting")
+    model = build_pipeline(best)
+    model.fit(reviews, labels)
+    leaderboard.sort(key=lambda entry: (-entry["round"], -entry["f1_macro"]))
+    return model, {
+        "best_params": {**best, "ngram_range": list(best["ngram_range"])},
+        # The leaderboard starts with the best candidate of the last round
+        "best_f1_macro": leaderboard[0]["f1_macro"] if leaderboard else None,
+        "candidates": len(candidates()),
+        "search_seconds": round(search_seconds, 3),
+        "budget_seconds": budget_seconds,
+        "budget_exhausted": budget_exhausted,
+        "leaderboard": leaderboard,
+    }
@@ -0,0 +1,104 @@
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional, Tuple
+
+from single_flight import SingleFlight
+
+
+class UserCache:
+    """
+    In-process TTL cache of user records keyed by login.
+
+    Unknown logins are cached as None for a shorter negative_ttl, so
+    requests with a wrong login don't reach the database either, while a
+    login registered through another server process becomes visible soon.
+    Concurrent misses of the same login share one database query. A lookup
+    which started before invalidate() is not cached, so a registration is
+    never hidden by a query that raced with it.
+
+    Args:
+        ttl: seconds a found user is served from memory
+        negative_ttl: seconds an unknown login is served from memory
+        max_entries: cached logins after which the least recently used
+            ones are evicted
+    """
+
+    def __init__(self, ttl: float, negative_ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries: OrderedDict[str, Tuple[Optional[dict], float]] = OrderedDict()
+        self._loading = SingleFlight()
+        self._generations: dict[str, int] = {}
+
+    async def get(
+            self,
+            login: str,
+            loader: Callable[[], Awaitable[Optional[dict]]]
+    ) -> Optional[dict]:
+        """
+        Args:
+            login: user login
+            loader: coroutine factory returning the user record or None,
+                called only once for concurrent misses of the same login
+        Returns:
+            Optional[dict]: user record, None for an unknown login
+        """
+        entry = self._entries.get(login)
+        if entry is not None:
+            user, expires = entry
+            if expires > time.monotonic():
+                self._entries.move_to_end(login)
+                self.hits += 1
+                return user
+            del self._entries[login]
+
+        if login in self._loading:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return await self._loading.run(login, lambda: self._load(login, loader))
+
+    async def _load(
+            self,
+            login: str,
+            loader: Callable[[], Awaitable[Optional[dict]]]
+    ) -> Optional[dict]:
+        generation = self._generations.get(login, 0)
+        try:
+            user = await loader()
+            if self._generations.get(login, 0) == generation:
+                self._put(login, user)
+            return user
+        finally:
+            self._generations.pop(login, None)
+
+    def _put(self, login: str, user: Optional[dict]):
+        ttl = self.ttl if user is not None else self.negative_ttl
+        if ttl <= 0:
+            return
+        self._entries[login] = (user, time.monotonic() + ttl)
+        self._entries.move_to_end(login)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, login: str):
+        self._entries.pop(login, None)
+        if login in self._loading:
+            self._generations[login] = self._generations.get(login, 0) + 1
+        self.invalidations += 1
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+        }
@@ -5,6 +5,7 @@ import itertools
 from io import StringIO
 import os
 import re
+import time
 import streamlit as st
 import requests
 import pandas as pd
@@ -35,6 +36,8 @@ model = st.query_params.get("model", None)
 uploaded_file = None
 requirement = "Review"
 STOPWORDS_RU = get_stop_words("russian")
+JOB_POLL_INTERVAL = 1
+JOB_TIMEOUT = 600
 
 
 def get_csv_from_s3(csv_id):
@@ -56,26 +59,54 @@ def get_csv_from_s3(csv_id):
     return None
 
 
+def wait_for_job(job_id):
+    """Polling prediction job until it is finished, returns predict id"""
+    deadline = time.monotonic() + JOB_TIMEOUT
+    while time.monotonic() < deadline:
+        answer_job = requests.get(
+            f"{URL}/jobs/{job_id}", params={"login": login}, timeout=30
+        )
+        if answer_job.status_code != 200:
+            logger.error("Job %s status is unavailable", job_id)
+            st.error("Критическая серверная ошибка")
+            return None
+        job = answer_job.json()
+        if job["state"] == "done":
+            return job["result"]["predict_id"]
+        if job["state"] not in ("queued", "running"):
+            logger.error("Job %s is %s: %s", job_id, job["state"], job["error"])
+            st.error(f"Ошибка классификации: {job['error'] or job['state']}")
+            return None
+        time.sleep(JOB_POLL_INTERVAL)
+    logger.error("Job %s is not finished after %s s", job_id, JOB_TIMEOUT)
+    st.error("Превышено время ожидания классификации")
+    return None
+
+
 def predict_request(reviews):
     """Trying to get labels from API's models"""
     logger.info("Trying to get predict (%s) for user %s", model, login)
     answer_predict = requests.post(
-        f"{URL}/predict/csv/{model}",
+        f"{URL}/jobs/predict/csv/{model}",
         data={"login": f"{login}"},
         files={"data_csv": ("input.csv", reviews.to_csv(index=False))},
         timeout=600,
     )
     if answer_predict.status_code == 200:
+        logger.info("Prediction job submitted")
+        predict_id = wait_for_job(answer_predict.json()["job_id"])
+        if predict_id is None:
+            return None
         logger.info("Predict received successfully")
-        result = pd.read_csv(get_csv_from_s3(answer_predict.text))
+        result = pd.read_csv(get_csv_from_s3(predict_id))
         result["predict"] = result["predict"].apply(
             lambda x: "Positive" if x else "Negative"
         )
         return result["predict"].tolist()
     if answer_predict.status_code == 404:
-        logger.error("There is no user with this login, or the model is incorrect.")
+        logger.error("There is no user with this login, or the data type is incorrect.")
         st.error(
-            "Не существует пользователя с таким логином, либо указана неверная модель"
+            "Не существует пользователя с таким логином, либо указан неверный тип данных"
         )
     else:
         logger.error("Critical error on server side")